@@ -0,0 +1,1732 @@
+"""
+Object graph model of IDA Object Viewer.
+
+Reads structure instances from memory and follows their pointers. Nothing in
+here depends on Qt: the graph is reported to a listener (see GraphListener),
+and IDA is only reached through a backend (see IDABackend). A backend with
+the same methods lets the traversal run in plain CPython.
+
+"""
+import struct
+import re
+import bisect
+import threading
+import mmap
+from collections import namedtuple, OrderedDict
+
+try:
+    import idc
+    import idaapi
+    import idautils
+except ImportError:
+    # Outside of IDA, only a custom backend can be used.
+    idc = idaapi = idautils = None
+
+try:
+    integer_types = (int, long)
+except NameError:
+    integer_types = (int,)
+
+"""
+struct struc_1 -> struc_1
+struc_1 ->  struc_1
+"""
+pattern = '^[ ]*(struct[ ]+)?'
+pat = re.compile(pattern)
+
+
+_scalar_formats = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+_ptr_formats = {16: 'H', 32: 'I', 64: 'Q'}
+_unpacker_cache = {}
+
+def compile_unpacker(fields, bits, endian):
+    """
+    Compile a member layout into a single struct.Struct.
+
+    Scalar and pointer members are decoded in one unpack_from call, gaps
+    and non-scalar members are skipped with pad bytes. The result is cached
+    per layout, so same-typed objects only pay the format building once.
+
+    :param fields: (offset, size, is_scalar, is_ptr) of every member, in offset order.
+    :type  fields: Tuple.
+
+    :param bits: Pointer width of the target.
+    :type  bits: Int.
+
+    :param endian: 'little' or 'big'.
+    :type  endian: Str.
+
+    :return: (struct.Struct, index of each member in the unpacked tuple or None)
+
+    """
+    key = (endian, bits, fields)
+    compiled = _unpacker_cache.get(key)
+    if compiled is not None:
+        return compiled
+
+    fmt = '>' if endian == 'big' else '<'
+    slots = []
+    cursor = 0
+    count = 0
+    for offset, size, is_scalar, is_ptr in fields:
+        if not is_scalar or offset < cursor:
+            # Overlapping members (of a union) are left undecoded.
+            slots.append(None)
+            continue
+        if offset > cursor:
+            fmt += str(offset - cursor) + 'x'
+        if is_ptr and size * 8 == bits:
+            fmt += _ptr_formats[bits]
+        else:
+            fmt += _scalar_formats[size]
+        cursor = offset + size
+        slots.append(count)
+        count += 1
+
+    compiled = (struct.Struct(fmt), slots)
+    _unpacker_cache[key] = compiled
+    return compiled
+
+
+def coalesce_ranges(ranges, gap, max_size=0x100000):
+    """
+    Merge (address, size) ranges that overlap or are at most gap bytes
+    apart, so they can be read at once.
+
+    :param max_size: A range isn't grown past this size.
+    :return: Sorted list of merged (address, size).
+    """
+    merged = []
+    for address, size in sorted(ranges):
+        if merged:
+            start, end = merged[-1]
+            if address - end <= gap and max(end, address + size) - start <= max_size:
+                merged[-1][1] = max(end, address + size)
+                continue
+        merged.append([address, address + size])
+    return [(start, end - start) for start, end in merged]
+
+
+def layered_layout(nodes, ranks, sizes, edges, x_gap=40, y_gap=40, sweeps=4):
+    """
+    Layered (Sugiyama-style) layout, layers from left to right.
+
+    Layers are ordered by barycenter sweeps to reduce crossings, then each
+    node is moved level with the rows it is connected from, without
+    overlapping the node above it. Only edges between adjacent layers
+    take part, longer ones get no dummy nodes. Each sweep sorts the
+    layers once, so the whole pass is O((V + E) log V).
+
+    :param nodes: Nodes, in their initial order.
+    :type  nodes: List.
+
+    :param ranks: Layer of each node.
+    :type  ranks: Dict.
+
+    :param sizes: (width, height) of each node.
+    :type  sizes: Dict.
+
+    :param edges: (src, src_y, dst, dst_y), the y of the connected rows
+                  relative to the top of their node.
+    :type  edges: List.
+
+    :return: (x, y) of each node.
+    """
+    layers = []
+    for node in nodes:
+        rank = ranks[node]
+        while len(layers) <= rank:
+            layers.append([])
+        layers[rank].append(node)
+
+    # Neighbors in the previous and the next layer, with the row offsets.
+    ups = dict((node, []) for node in nodes)
+    downs = dict((node, []) for node in nodes)
+    for src, src_y, dst, dst_y in edges:
+        if ranks[dst] == ranks[src] + 1:
+            ups[dst].append((src, src_y, dst_y))
+            downs[src].append((dst, dst_y, src_y))
+        elif ranks[src] == ranks[dst] + 1:
+            ups[src].append((dst, dst_y, src_y))
+            downs[dst].append((src, src_y, dst_y))
+
+    position = dict()
+    for layer in layers:
+        for i, node in enumerate(layer):
+            position[node] = i
+
+    def sort_layer(layer, neighbors):
+        keys = dict()
+        for node in layer:
+            linked = neighbors[node]
+            if linked:
+                # Rows further down the neighbor count a bit more, so the
+                # children of one node keep the order of its members.
+                keys[node] = sum(position[other] + float(other_y) / (sizes[other][1] + 1)
+                                 for other, other_y, y in linked) / len(linked)
+            else:
+                keys[node] = position[node]
+        layer.sort(key=keys.__getitem__)
+        for i, node in enumerate(layer):
+            position[node] = i
+
+    for sweep in range(sweeps):
+        if sweep % 2 == 0:
+            for layer in layers[1:]:
+                sort_layer(layer, ups)
+        else:
+            for layer in reversed(layers[:-1]):
+                sort_layer(layer, downs)
+
+    coords = dict()
+    x = 0
+    for layer in layers:
+        bottom = None
+        for node in layer:
+            linked = ups[node]
+            if linked:
+                y = sum(coords[other][1] + other_y - node_y for other, other_y, node_y in linked) / float(len(linked))
+            else:
+                y = 0 if bottom is None else bottom
+            if bottom is not None:
+                y = max(y, bottom)
+            coords[node] = (x, y)
+            bottom = y + sizes[node][1] + y_gap
+        if layer:
+            x += max(sizes[node][0] for node in layer) + x_gap
+    return coords
+
+
+class NotDefinedObjectException(Exception):
+    def __init__(self, msg):
+        super(NotDefinedObjectException, self).__init__(msg)
+
+class NoMemberFoundException(Exception):
+    def __init__(self, msg):
+        super(NoMemberFoundException, self).__init__(msg)
+
+class MemoryReadException(Exception):
+    def __init__(self, msg):
+        super(MemoryReadException, self).__init__(msg)
+
+class SnapshotException(Exception):
+    def __init__(self, msg):
+        super(SnapshotException, self).__init__(msg)
+
+
+MemberLayout = namedtuple('MemberLayout', ['offset', 'name', 'size', 'flag', 'member_id', 'type', 'is_ptr', 'is_scalar', 'ptr_struct_name',
+                                           'element_size', 'element_struct_id'])
+
+class StructLayout(object):
+    """
+    Immutable member table of a structure.
+
+    Shared by every CObject of that type. IDABackend builds it from the IDB,
+    other backends may build it from plain MemberLayout tuples.
+
+    """
+
+    def __init__(self, struct_id, size, is_union, members, bits, endian):
+        self.struct_id = struct_id
+        self.size = size
+        self.is_union = is_union
+        self.members = tuple(members)
+        # Sorted member offsets, to resolve interior pointers by bisection.
+        self.offsets = tuple(m.offset for m in self.members)
+
+        # Decode every scalar and pointer member at once.
+        self.unpacker, self.slots = compile_unpacker(tuple((m.offset, m.size, m.is_scalar, m.is_ptr) for m in self.members),
+                                                     bits, endian)
+
+
+_layout_cache = {}
+
+def invalidate_struct_layouts(struct_id=None):
+    """
+    Drop the cached layout of struct_id, or every cached layout if None.
+
+    """
+    if struct_id is None:
+        _layout_cache.clear()
+    else:
+        _layout_cache.pop(struct_id, None)
+
+
+class IDABackend(object):
+    """
+    Structures and memory of the current IDB (or debuggee).
+
+    The model only calls struct_id, struct_layout, read, prefetch and
+    is_mapped, and reads bits and endian. Any object providing them can
+    replace this one.
+
+    """
+
+    def __init__(self, bits, endian):
+        self.bits = bits
+        self.endian = endian
+
+    def struct_id(self, struct_name):
+        """
+
+        :return: Id of the structure, or None if it isn't defined.
+        """
+        struct_id = idaapi.get_struc_id(struct_name)
+        if struct_id == idc.BADADDR:
+            return None
+        return struct_id
+
+    def struct_layout(self, struct_id):
+        """
+        Return the cached StructLayout of struct_id, building it on first use.
+
+        """
+        layout = _layout_cache.get(struct_id)
+        if layout is None:
+            layout = self._build_layout(struct_id)
+            _layout_cache[struct_id] = layout
+        return layout
+
+    def read(self, address, size):
+        """
+
+        :return: size bytes at address, or None.
+        """
+        # even if use_dbg=False, get_bytes read memory from debugger. TODO check if this is true.
+        return idc.get_bytes(address, size, False)
+
+    def is_mapped(self, address):
+        return idc.is_mapped(address)
+
+    def prefetch(self, ranges):
+        """
+        Hint that the (address, size) ranges will be read soon.
+
+        Nothing is cached here, see CachedBackend.
+        """
+        pass
+
+    def _is_scalar_member(self, flag, size, member_type):
+        """
+        Return True if the member is decoded as an integer (plain integer or pointer).
+
+        """
+        if member_type is None:
+            # Didn't defined type explicitly.
+
+            # Default value is integer(size=1,2,4,8).
+            if (idc.is_byte(flag) and size == 1) or (idc.is_word(flag) and size == 2) or (idc.is_dword(flag) and size == 4) or (idc.is_qword(flag) and size == 8):
+                return True
+            # maybe list
+            # TODO handle correctly if type isn't array (enum, bitfield, ...)
+            if idc.is_enum0(flag) or idc.is_bf(flag):
+                raise Exception("Not implemented")
+            return False
+        # Struct or type defined explicitly.
+        return bool(idc.is_off0(flag)) and size in _scalar_formats
+
+    def _build_layout(self, struct_id):
+        members = []
+        for offset, name, size in idautils.StructMembers(struct_id):
+            flag = idc.get_member_flag(struct_id, offset)
+            member_id = idc.get_member_id(struct_id, offset)
+            member_type = idc.get_type(member_id)
+            if member_type is not None:
+                member_type = re.sub(pat, '', member_type)
+            is_ptr = bool(idc.is_off0(flag))
+            # struc_x *** -> struc_x **
+            ptr_struct_name = None
+            if is_ptr and member_type is not None and member_type[-1] == '*':
+                ptr_struct_name = member_type[:-1].rstrip(' ')
+            is_scalar = self._is_scalar_member(flag, size, member_type)
+            # dw/dd/dq and struct arrays are expanded element by element.
+            element_size = None
+            element_struct_id = None
+            if not is_scalar:
+                if idc.is_struct(flag):
+                    element_struct_id = idc.get_member_strid(struct_id, offset)
+                    element_size = idc.get_struc_size(element_struct_id)
+                elif idc.is_word(flag):
+                    element_size = 2
+                elif idc.is_dword(flag):
+                    element_size = 4
+                elif idc.is_qword(flag):
+                    element_size = 8
+                if not element_size or size <= element_size or size % element_size:
+                    element_size = None
+                    element_struct_id = None
+            members.append(MemberLayout(offset, name, size, flag, member_id, member_type, is_ptr,
+                                        is_scalar, ptr_struct_name, element_size, element_struct_id))
+        return StructLayout(struct_id, idc.get_struc_size(struct_id), bool(idc.is_union(struct_id)), members,
+                            self.bits, self.endian)
+
+
+class SyncedIDABackend(IDABackend):
+    """
+    IDABackend for a worker thread.
+
+    The IDA API may only be called from the main thread, every call is
+    marshalled there with execute_sync.
+
+    """
+
+    def _sync(self, func, *args):
+        result = []
+        error = []
+
+        def call():
+            try:
+                result.append(func(*args))
+            except Exception as e:
+                error.append(e)
+            return 0
+
+        idaapi.execute_sync(call, idaapi.MFF_READ)
+        if error:
+            raise error[0]
+        return result[0]
+
+    def struct_id(self, struct_name):
+        return self._sync(IDABackend.struct_id, self, struct_name)
+
+    def read(self, address, size):
+        return self._sync(IDABackend.read, self, address, size)
+
+    def is_mapped(self, address):
+        return self._sync(IDABackend.is_mapped, self, address)
+
+    def _build_layout(self, struct_id):
+        return self._sync(IDABackend._build_layout, self, struct_id)
+
+
+class CachedBackend(object):
+    """
+    Page cache in front of the reads of another backend.
+
+    Reads are served from whole pages kept in LRU order, up to max_bytes.
+    invalidate() drops them and bumps generation, call it whenever the
+    memory may have changed (debugger stop, patch, new process). hits and
+    misses count pages.
+
+    """
+
+    def __init__(self, backend, page_size=0x1000, max_bytes=0x1000000):
+        self.backend = backend
+        self.bits = backend.bits
+        self.endian = backend.endian
+        self.page_size = page_size
+        self.max_pages = max(1, max_bytes // page_size)
+        # Page address -> bytes, oldest first. None if the page can't be read whole.
+        self.pages = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        # Reads come from the worker thread, invalidations from the UI thread.
+        self.lock = threading.Lock()
+
+    def struct_id(self, struct_name):
+        return self.backend.struct_id(struct_name)
+
+    def struct_layout(self, struct_id):
+        return self.backend.struct_layout(struct_id)
+
+    def is_mapped(self, address):
+        return self.backend.is_mapped(address)
+
+    def invalidate(self):
+        with self.lock:
+            self.pages.clear()
+            self.generation += 1
+
+    def _page(self, address):
+        with self.lock:
+            page = self.pages.pop(address, False)
+            if page is not False:
+                self.pages[address] = page
+                self.hits += 1
+                return page
+            self.misses += 1
+            generation = self.generation
+
+        page = self.backend.read(address, self.page_size)
+        if page is not None and len(page) != self.page_size:
+            page = None
+        with self.lock:
+            # Don't keep a page read before an invalidation.
+            if generation == self.generation:
+                self.pages[address] = page
+                if len(self.pages) > self.max_pages:
+                    self.pages.popitem(last=False)
+        return page
+
+    def prefetch(self, ranges):
+        """
+        Read the missing pages of each range, one backend read per run of
+        consecutive missing pages.
+
+        """
+        for address, size in ranges:
+            first = address - address % self.page_size
+            run = []
+            for page_address in range(first, address + size, self.page_size):
+                with self.lock:
+                    cached = page_address in self.pages
+                if not cached:
+                    run.append(page_address)
+                    continue
+                self._fetch_run(run)
+                run = []
+            self._fetch_run(run)
+
+    def _fetch_run(self, run):
+        # Pages cut by the start or end of a segment are left to read().
+        while run and not self.backend.is_mapped(run[0]):
+            run = run[1:]
+        while run and not self.backend.is_mapped(run[-1] + self.page_size - 1):
+            run = run[:-1]
+        if not run:
+            return
+        with self.lock:
+            generation = self.generation
+        data = self.backend.read(run[0], len(run) * self.page_size)
+        if data is None or len(data) != len(run) * self.page_size:
+            # Holes inside the run, split it. A single page is left to read().
+            if len(run) > 1:
+                self._fetch_run(run[:len(run) // 2])
+                self._fetch_run(run[len(run) // 2:])
+            return
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.misses += len(run)
+            for i, page_address in enumerate(run):
+                self.pages.pop(page_address, None)
+                self.pages[page_address] = data[i * self.page_size:(i + 1) * self.page_size]
+            while len(self.pages) > self.max_pages:
+                self.pages.popitem(last=False)
+
+    def read(self, address, size):
+        """
+
+        :return: size bytes at address, or None.
+        """
+        first = address - address % self.page_size
+        chunks = []
+        for page_address in range(first, address + size, self.page_size):
+            page = self._page(page_address)
+            if page is None:
+                # Partly mapped page, read the range itself.
+                return self.backend.read(address, size)
+            chunks.append(page)
+        start = address - first
+        if len(chunks) == 1:
+            return chunks[0][start:start + size]
+        return b''.join(chunks)[start:start + size]
+
+
+# A node row: its label and what it stands for.
+# kind is one of 'member', 'array', 'element', 'header', 'item', 'control'.
+Row = namedtuple('Row', ['label', 'kind'])
+
+class GraphListener(object):
+    """
+    Receives the changes of a CObjectManager graph, e.g. to draw it.
+
+    Events come in order and carry the labels at the time they happened.
+
+    """
+
+    def object_added(self, obj, rows):
+        """
+        A CObject or CList was added, with its rows.
+
+        """
+        pass
+
+    def rows_changed(self, obj, rows):
+        """
+        The rows of obj changed (stub expanded, array scrolled, page turned).
+
+        """
+        pass
+
+    def edge_added(self, src, src_label, dst, dst_label):
+        """
+        The row src_label of src points to the row dst_label of dst.
+
+        """
+        pass
+
+    def graph_built(self, root):
+        """
+        The traversal from root is finished.
+
+        """
+        pass
+
+    def object_expanded(self, obj):
+        """
+        obj was added by expanding a stub of its parent.
+
+        """
+        pass
+
+    def edge_removed(self, src, src_label):
+        """
+        The row src_label of src no longer points to anything.
+
+        """
+        pass
+
+    def values_changed(self, obj, rows, changed):
+        """
+        The memory of obj changed since it was read. rows are its new rows,
+        changed the labels of the rows that differ from the previous ones.
+
+        """
+        pass
+
+
+class CMember(object):
+
+    def __init__(self, address, layout, idx, cobject=None, data=None, value=None):
+        self.address = address
+        self.layout = layout
+        self.offset = layout.offset
+        self.name = layout.name
+        self.size = layout.size
+        self.flag = layout.flag
+        self.member_id = layout.member_id
+        self.type = layout.type
+        self.is_array = False
+        self.idx = idx
+        self.cobject = cobject
+        self.connected_cobject = None
+        # True when the pointee was not expanded (depth or budget exceeded).
+        self.truncated = False
+        # CArray window when this member is an expanded array.
+        self.array = None
+        # memoryview slice of the owner's buffer (no copy).
+        self.data = data
+        if value is not None:
+            # Integer or pointer, already decoded by the owner's unpacker.
+            self.value = value
+        else:
+            # maybe list
+            self.is_array = self.type is None
+            # handle type.
+            self.value = self.data
+        # TODO
+        # if self.is_ptr() -> Find CMember to which it points.(via CObjectManager?)
+
+    def connect(self, target_cmember):
+        self.connected_cobject = target_cmember
+        self.cobject.cmanager.listener.edge_added(self.cobject, str(self), target_cmember.cobject, str(target_cmember))
+
+    @property
+    def is_ptr(self):
+        return self.layout.is_ptr
+
+    @property
+    def is_valid_ptr(self):
+        """
+
+        :return:
+        """
+        return self.is_ptr and self.cobject.cmanager.backend.is_mapped(self.value)
+
+    @property
+    def ptr_struct_name(self):
+        """
+        Handy dereference structure name.
+        struc_x *** -> struc_x **
+        :return: structure name to which CMember point.
+        """
+        assert self.is_ptr
+        return self.layout.ptr_struct_name
+
+    @property
+    def is_struct(self):
+        return idc.is_struct(self.flag)
+
+    def __repr__(self):
+        # Do you want type name?
+        # TODO if string, preview string?
+        if isinstance(self.value, integer_types):
+            text = self.name + '  ' + ("0x{0:0" + str(self.size * 2) + "x}").format(self.value)
+            if self.truncated:
+                text += '  ...'
+            return text
+        elif self.array is not None:
+            return self.name + '  [' + str(self.array.count) + ']'
+        else:
+            return self.name + '  ' + "PREVIEW"
+
+
+class CObject(object):
+
+    def __init__(self, address, struct_name, cmanager, parent_cmember=None):
+        self.address = address
+        self.members = []
+        self.struct_name = re.sub(pat, '', struct_name)
+        self.cmanager = cmanager
+        backend = cmanager.backend
+        self.struct_id = backend.struct_id(self.struct_name)
+        # set parent object
+        self.parent_cmember = parent_cmember
+        self.depth = 0 if parent_cmember is None else parent_cmember.cobject.depth + 1
+        # Objects first discovered through one of our members.
+        self.children = []
+        if self.struct_id is None:
+            raise NotDefinedObjectException(self.struct_name + ' isn\'t defined. Please insert into structure window.')
+        self.layout = backend.struct_layout(self.struct_id)
+        self.size = self.layout.size
+        if self.layout.is_union:
+            raise NotDefinedObjectException("Union Not supported now.")
+
+        # Read the whole object at once. Members only keep a slice of it.
+        self.raw = backend.read(address, self.size)
+        if self.raw is None or len(self.raw) != self.size:
+            raise MemoryReadException("Failed to read " + hex(self.size) + " bytes at " + hex(address))
+        buf = memoryview(self.raw)
+
+        # Decode every scalar and pointer member at once.
+        values = self.layout.unpacker.unpack_from(buf)
+        slots = self.layout.slots
+
+        idx = 0
+        for member in self.layout.members:
+            # TODO if member is struct, expand struct members.
+            slot = slots[idx]
+            cmember = CMember(address + member.offset, member, idx, cobject=self,
+                              data=buf[member.offset:member.offset + member.size],
+                              value=None if slot is None else values[slot])
+            if member.element_size is not None and not (member.element_struct_id is not None and
+                                                        backend.struct_layout(member.element_struct_id).is_union):
+                # Arrays of unions are shown as one row.
+                cmember.array = CArray(cmember)
+            self.members.append(cmember)
+            idx += 1
+        if self.members is []:
+            raise NoMemberFoundException("No member found at " + struct_name)
+
+    @property
+    def rows(self):
+        rows = []
+        for member in self.members:
+            if member.array is None:
+                rows.append(Row(str(member), 'member'))
+            else:
+                rows.append(Row(str(member), 'array'))
+                rows.extend(Row(label, 'element') for label in member.array.rows)
+        return rows
+
+    def rows_changed(self):
+        self.cmanager.listener.rows_changed(self, self.rows)
+
+    def reload(self, raw):
+        """
+        Decode raw, the current bytes of the object, in place.
+
+        :return: Members whose bytes changed.
+        """
+        old = self.raw
+        self.raw = raw
+        buf = memoryview(raw)
+        values = self.layout.unpacker.unpack_from(buf)
+        changed = []
+        for member, slot in zip(self.members, self.layout.slots):
+            start = member.offset
+            end = start + member.size
+            member.data = buf[start:end]
+            if old[start:end] == raw[start:end]:
+                continue
+            member.value = member.data if slot is None else values[slot]
+            if member.array is not None:
+                member.array.refresh()
+            changed.append(member)
+        return changed
+
+    def is_contain(self, address):
+        if self.address <= address < self.address + self.size:
+            return True
+        return False
+
+    def on_attr_scrolled(self, attr_name, steps):
+        for member in self.members:
+            if member.array is not None and (attr_name == str(member) or attr_name in member.array.rows):
+                if member.array.scroll_to(member.array.start + steps):
+                    self.rows_changed()
+                return
+
+    def search_cmember(self, address):
+        offset = address - self.address
+        idx = bisect.bisect_right(self.layout.offsets, offset) - 1
+        if idx >= 0:
+            member = self.members[idx]
+            if member.offset <= offset < member.offset + member.size:
+                return member
+        return None
+
+    def __repr__(self):
+        return self.struct_name + '@' + hex(self.address)
+
+
+class CArray(object):
+    """
+    Window over the elements of an array member.
+
+    Only array_window elements get a row in the node. They are decoded from
+    the owner's buffer when they scroll into view.
+
+    """
+
+    def __init__(self, cmember):
+        self.cmember = cmember
+        cmanager = cmember.cobject.cmanager
+        backend = cmanager.backend
+        self.window = cmanager.array_window
+        self.element_size = cmember.layout.element_size
+        self.count = cmember.size // self.element_size
+        if cmember.layout.element_struct_id is not None:
+            self.layout = backend.struct_layout(cmember.layout.element_struct_id)
+            self.unpacker = self.layout.unpacker
+        else:
+            self.layout = None
+            self.unpacker = compile_unpacker(((0, self.element_size, True, False),), backend.bits, backend.endian)[0]
+        self.start = 0
+        self.rows = []
+        self.scroll_to(0)
+
+    def row_label(self, idx):
+        """
+
+        :return: "name[idx]  value" or "name[idx]  member=value ..."
+        """
+        values = self.unpacker.unpack_from(self.cmember.data, idx * self.element_size)
+        label = '  ' + self.cmember.name + '[' + str(idx) + ']  '
+        if self.layout is None:
+            return label + ("0x{0:0" + str(self.element_size * 2) + "x}").format(values[0])
+        fields = []
+        for member, slot in zip(self.layout.members, self.layout.slots):
+            if slot is not None:
+                fields.append(member.name + '=0x{0:x}'.format(values[slot]))
+        return label + ' '.join(fields)
+
+    def scroll_to(self, start):
+        """
+        Show the window elements from start.
+
+        :return: True when the rows changed.
+        """
+        start = max(0, min(start, self.count - self.window))
+        if self.rows and start == self.start:
+            return False
+        self.rows = [self.row_label(i) for i in range(start, min(start + self.window, self.count))]
+        self.start = start
+        return True
+
+    def refresh(self):
+        """
+        Decode the visible elements again, after the owner was reloaded.
+
+        """
+        self.rows = [self.row_label(i) for i in range(self.start, min(self.start + self.window, self.count))]
+
+
+class CList(object):
+    """
+    Chain of same-typed objects linked through one pointer member.
+
+    Shown as a single node with one row per element of the current page.
+    Elements are only read and decoded when their page is shown.
+
+    """
+
+    prev_label = '<< prev page'
+    next_label = 'next page >>'
+
+    def __init__(self, address, struct_name, layout, link, cmanager, parent_cmember=None):
+        self.address = address
+        self.struct_name = struct_name
+        self.layout = layout
+        self.size = layout.size
+        # MemberLayout of the pointer to the next element.
+        self.link = link
+        self.cmanager = cmanager
+        self.backend = cmanager.backend
+        self.page_size = cmanager.list_page_size
+        self.parent_cmember = parent_cmember
+        self.depth = 0 if parent_cmember is None else parent_cmember.cobject.depth + 1
+        self.children = []
+
+        # Element addresses discovered so far.
+        self.addresses = [address]
+        self.visited = set(self.addresses)
+        self.complete = False
+        self._link_unpacker = compile_unpacker(((0, link.size, True, True),), self.backend.bits, self.backend.endian)[0]
+
+        self.page = None
+        self.items = []
+        self.header = 'via ' + link.name
+        self.show_page(0)
+
+    @property
+    def rows(self):
+        return ([Row(self.header, 'header')] +
+                [Row(label, 'item') for label in self.items] +
+                [Row(self.prev_label, 'control'), Row(self.next_label, 'control')])
+
+    def attach(self, cmember):
+        """
+        Connect cmember to the head of this list.
+
+        """
+        cmember.connected_cobject = self
+        self.cmanager.listener.edge_added(cmember.cobject, str(cmember), self, self.header)
+
+    def walk(self, count):
+        """
+        Follow the link member until count elements are known or the chain ends.
+
+        """
+        while len(self.addresses) < count and not self.complete:
+            raw = self.backend.read(self.addresses[-1] + self.link.offset, self.link.size)
+            address = None
+            if raw is not None and len(raw) == self.link.size:
+                address = self._link_unpacker.unpack_from(raw)[0]
+            if (not address or address in self.visited or not self.backend.is_mapped(address) or
+                    self.cmanager.is_contain(address)):
+                self.complete = True
+            else:
+                self.addresses.append(address)
+                self.visited.add(address)
+
+    def row_label(self, idx):
+        """
+        Read and decode one element.
+
+        :return: "[idx] address  member=value ..."
+        """
+        address = self.addresses[idx]
+        label = '[{0}] 0x{1:x}'.format(idx, address)
+        raw = self.backend.read(address, self.size)
+        if raw is None or len(raw) != self.size:
+            return label + '  ??'
+        values = self.layout.unpacker.unpack_from(raw)
+        fields = []
+        for member, slot in zip(self.layout.members, self.layout.slots):
+            if slot is not None and member is not self.link:
+                fields.append(member.name + '=0x{0:x}'.format(values[slot]))
+        return label + '  ' + ' '.join(fields)
+
+    def show_page(self, page):
+        """
+        Replace the element rows with the given page.
+
+        :return: True when the rows changed.
+        """
+        start = page * self.page_size
+        # One more element tells whether a next page exists.
+        self.walk(start + self.page_size + 1)
+        if page < 0 or start >= len(self.addresses) or page == self.page:
+            return False
+        self.page = page
+        self.items = [self.row_label(i) for i in range(start, min(start + self.page_size, len(self.addresses)))]
+        return True
+
+    def reload(self):
+        """
+        Walk the chain again and read the current page.
+
+        """
+        self.addresses = [self.address]
+        self.visited = set(self.addresses)
+        self.complete = False
+        page = self.page
+        self.page = None
+        if not self.show_page(page):
+            # The chain got shorter.
+            self.show_page(0)
+
+    def on_attr_double_clicked(self, attr_name):
+        changed = False
+        if attr_name == self.prev_label:
+            changed = self.show_page(self.page - 1)
+        elif attr_name == self.next_label:
+            changed = self.show_page(self.page + 1)
+        if changed:
+            self.cmanager.listener.rows_changed(self, self.rows)
+
+    def __repr__(self):
+        return self.struct_name + ' list@' + hex(self.address)
+
+
+class _AddressIndex(object):
+    """
+    Objects by address range, sorted by start address.
+
+    max_ends[i] is the largest end of the ranges up to i. An address past
+    it is in none of them, so a miss costs one bisect, and a hit only
+    looks back past ranges nested in a larger one.
+
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.objects = []
+        self.max_ends = []
+
+    def insert(self, start, size, obj):
+        end = start + size
+        i = bisect.bisect_right(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.objects.insert(i, obj)
+        self.max_ends.insert(i, max(end, self.max_ends[i - 1]) if i else end)
+        # Raise the maxima after it, up to the first one already larger.
+        i += 1
+        while i < len(self.max_ends) and self.max_ends[i] < end:
+            self.max_ends[i] = end
+            i += 1
+
+    def remove(self, obj):
+        """
+        Remove every range of obj.
+
+        """
+        kept = [i for i, other in enumerate(self.objects) if other is not obj]
+        self.starts = [self.starts[i] for i in kept]
+        self.ends = [self.ends[i] for i in kept]
+        self.objects = [self.objects[i] for i in kept]
+        self.max_ends = []
+        max_end = 0
+        for end in self.ends:
+            max_end = max(max_end, end)
+            self.max_ends.append(max_end)
+
+    def search(self, address):
+        """
+
+        :return: Object of the last starting range which contains the address, or None.
+        """
+        i = bisect.bisect_right(self.starts, address) - 1
+        while i >= 0 and self.max_ends[i] > address:
+            if address < self.ends[i]:
+                return self.objects[i]
+            i -= 1
+        return None
+
+
+class CObjectManager(object):
+    """
+    Graph of the objects reachable from a main object.
+
+    Call build() to run the traversal, the listener receives the graph.
+
+    """
+
+    def __init__(self, backend, main_address, main_struct_name, listener=None, max_depth=2, max_nodes=300, max_bytes=0x100000,
+                 list_min_length=4, list_page_size=16, array_window=8, read_gap=0x1000, saved_graph=None):
+        self.backend = backend
+        self.listener = listener if listener is not None else GraphListener()
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_bytes = max_bytes
+        self.list_min_length = list_min_length
+        self.list_page_size = list_page_size
+        self.array_window = array_window
+        # Reads closer than this are merged.
+        self.read_gap = read_gap
+        # SavedGraph that build() restores instead of traversing.
+        self.saved_graph = saved_graph
+        self.total_bytes = 0
+        # Pointer members left unexpanded by the limits above.
+        self.truncated = []
+        self.main_address = main_address
+        self.main_struct_name = main_struct_name
+        self.cobjects = []
+        # Objects by node name.
+        self.nodes = dict()
+        # Collapsed linked lists, by node name.
+        self.clists = dict()
+        # Interval index of the objects.
+        self._cobject_index = _AddressIndex()
+        # Interval index of the list elements walked so far.
+        self._element_index = _AddressIndex()
+        # List -> number of its elements in the index.
+        self._indexed_elements = dict()
+        # Pointee type name -> StructLayout, or None if it isn't a structure.
+        self._pointee_layouts = dict()
+        self.cancelled = False
+
+    def cancel(self):
+        """
+        Stop a build() running on another thread.
+
+        """
+        self.cancelled = True
+
+    def debug_dump(self):
+        for cobject in self.cobjects:
+            print("CObject : " + hex(cobject.address))
+            print("==============================")
+            for member in cobject.members:
+                print(member)
+            print("==============================")
+
+    def add_cobject(self, address, struct_name, parent_cmember=None):
+        if self.is_contain(address):
+            return
+        cobj = CObject(address, struct_name, cmanager=self, parent_cmember=parent_cmember)
+        self.cobjects.append(cobj)
+        self.nodes[str(cobj)] = cobj
+        self._cobject_index.insert(cobj.address, cobj.size, cobj)
+        self.total_bytes += cobj.size
+        if parent_cmember is not None:
+            parent_cmember.cobject.children.append(cobj)
+        self.listener.object_added(cobj, cobj.rows)
+        return cobj
+
+    def pointee_layout(self, name):
+        """
+
+        :param name: Pointee type name of a pointer member, or None.
+        :return: StructLayout of the pointee, or None when the pointee
+                 isn't a structure CObject can decode (char, void, union...).
+        """
+        if name not in self._pointee_layouts:
+            layout = None
+            if name is not None:
+                struct_id = self.backend.struct_id(re.sub(pat, '', name))
+                if struct_id is not None:
+                    layout = self.backend.struct_layout(struct_id)
+                    if layout.is_union:
+                        layout = None
+            self._pointee_layouts[name] = layout
+        return self._pointee_layouts[name]
+
+    def can_expand(self, depth, depth_limit):
+        """
+
+        :param depth: Depth of the object to be added.
+        :param depth_limit: Deepest depth allowed.
+        :return: True when the limits allow one more object.
+        """
+        return (depth <= depth_limit and
+                len(self.cobjects) < self.max_nodes and
+                self.total_bytes < self.max_bytes)
+
+    def visit(self, cobj, depth_limit, pointers=None):
+        """
+        Connect the pointer members of cobj. Pointees past depth_limit or
+        the budget are left as truncated stubs.
+
+        :param pointers: Valid pointer members of cobj, as found by targets().
+        :return: Newly added child objects.
+        """
+        if pointers is None:
+            pointers = [member for member in cobj.members if member.is_valid_ptr]
+        children = []
+        truncated = False
+        for member in pointers:
+            if self.is_contain(member.value):
+                # address already exists.
+                self.link(member)
+            elif self.pointee_layout(member.ptr_struct_name) is None:
+                # Unknown or non-structure pointee type.
+                continue
+            elif not self.can_expand(cobj.depth + 1, depth_limit):
+                member.truncated = True
+                self.truncated.append(member)
+                truncated = True
+            elif self.is_chain(cobj, member):
+                self.add_clist(member)
+            else:
+                try:
+                    child = self.add_cobject(member.value, member.ptr_struct_name, parent_cmember=member)
+                except MemoryReadException:
+                    # Pointee not readable as a whole, keep a plain pointer.
+                    continue
+                member.connect(child.members[0]) # connect to top member
+                children.append(child)
+        if truncated:
+            cobj.rows_changed()
+        return children
+
+    def is_chain(self, cobj, member):
+        """
+        Check whether member links at least list_min_length objects of the
+        type of cobj. Other pointers to the same type may only point back to
+        the previous element (doubly linked list), so trees are not collapsed.
+
+        """
+        if self.list_min_length <= 0 or member.ptr_struct_name != cobj.struct_name:
+            return False
+        layout = cobj.layout
+        link_slot = layout.slots[member.idx]
+        backlink_slots = [layout.slots[i] for i, m in enumerate(layout.members)
+                          if m.ptr_struct_name == cobj.struct_name and i != member.idx]
+        prev = cobj.address
+        address = member.value
+        visited = set([prev])
+        for i in range(self.list_min_length):
+            if not address or address in visited or not self.backend.is_mapped(address) or self.is_contain(address):
+                return False
+            raw = self.backend.read(address, layout.size)
+            if raw is None or len(raw) != layout.size:
+                return False
+            values = layout.unpacker.unpack_from(raw)
+            for slot in backlink_slots:
+                if slot is not None and values[slot] not in (0, prev):
+                    return False
+            visited.add(address)
+            prev = address
+            address = values[link_slot]
+        return True
+
+    def add_clist(self, member):
+        cobj = member.cobject
+        clist = CList(member.value, cobj.struct_name, cobj.layout, member.layout, cmanager=self, parent_cmember=member)
+        self.clists[str(clist)] = clist
+        self._index_elements(clist)
+        cobj.children.append(clist)
+        self.listener.object_added(clist, clist.rows)
+        clist.attach(member)
+        return clist
+
+    def build(self):
+        """
+        Breadth-first traversal from the main object, bounded by max_depth,
+        max_nodes and max_bytes. Stops early after cancel().
+
+        """
+        if self.saved_graph is not None:
+            root = self.restore(self.saved_graph)
+            self.listener.graph_built(root)
+            return root
+
+        root = self.add_cobject(self.main_address, self.main_struct_name)
+        level = [root]
+        while level and not self.cancelled:
+            # Read the whole frontier with as few reads as possible.
+            ranges, pointers = self.targets(level)
+            self.backend.prefetch(coalesce_ranges(ranges, self.read_gap))
+            next_level = []
+            for cobj in level:
+                if self.cancelled:
+                    break
+                next_level.extend(self.visit(cobj, self.max_depth, pointers[cobj]))
+            level = next_level
+        self.listener.graph_built(root)
+        return root
+
+    def restore(self, graph):
+        """
+        Add the objects, lists, edges and stubs of a saved graph, without
+        traversing. The limits don't apply: everything saved comes back,
+        as it was before stubs were expanded past them.
+
+        :param graph: SavedGraph of a snapshot.
+        :type  graph: SavedGraph.
+
+        :return: Root object.
+        """
+        self.list_min_length = graph.list_min_length
+        cobjs = []
+        for address, struct_name, parent in graph.objects:
+            if self.cancelled:
+                return cobjs[0] if cobjs else None
+            parent_cmember = None if parent is None else cobjs[parent[0]].members[parent[1]]
+            cobjs.append(self.add_cobject(address, struct_name, parent_cmember=parent_cmember))
+
+        for obj, idx in graph.lists:
+            self.add_clist(cobjs[obj].members[idx])
+        for obj, idx in graph.edges:
+            member = cobjs[obj].members[idx]
+            # Parents of lists are already attached.
+            if member.connected_cobject is None:
+                self.link(member)
+        stubs = set()
+        for obj, idx in graph.truncated:
+            member = cobjs[obj].members[idx]
+            member.truncated = True
+            self.truncated.append(member)
+            stubs.add(obj)
+        for obj in sorted(stubs):
+            cobjs[obj].rows_changed()
+        return cobjs[0] if cobjs else None
+
+    def targets(self, cobjs):
+        """
+        Find the objects the pointers of cobjs may add. Pointees the limits
+        would leave as stubs are not read, the nodes and bytes taken by the
+        previous ones are counted ahead of visit().
+
+        :return: (address, size) of the objects to read, and the valid
+                 pointer members of every object of cobjs.
+        """
+        ranges = []
+        pointers = dict()
+        seen = set()
+        nodes = len(self.cobjects)
+        total_bytes = self.total_bytes
+        for cobj in cobjs:
+            pointers[cobj] = [member for member in cobj.members if member.is_valid_ptr]
+            if not self.can_expand(cobj.depth + 1, self.max_depth):
+                continue
+            for member in pointers[cobj]:
+                if nodes >= self.max_nodes or total_bytes >= self.max_bytes:
+                    break
+                layout = self.pointee_layout(member.ptr_struct_name)
+                if layout is None or not layout.size or member.value in seen or self.is_contain(member.value):
+                    continue
+                ranges.append((member.value, layout.size))
+                seen.add(member.value)
+                nodes += 1
+                total_bytes += layout.size
+        return ranges, pointers
+
+    def expand(self, member):
+        """
+        Expand a truncated pointer member by one level, in place.
+
+        :param member: Truncated CMember.
+        :return: The new CObject, or None if nothing was added.
+        """
+        if not member.truncated:
+            return None
+        member.truncated = False
+        self.truncated.remove(member)
+        member.cobject.rows_changed()
+        if self.is_contain(member.value):
+            self.link(member)
+            return None
+
+        try:
+            child = self.add_cobject(member.value, member.ptr_struct_name, parent_cmember=member)
+        except MemoryReadException:
+            # Pointee not readable as a whole, keep a plain pointer.
+            return None
+        member.connect(child.members[0]) # connect to top member
+        self.listener.object_expanded(child)
+        # Pointers of the new object stay collapsed.
+        self.visit(child, child.depth)
+
+        # Other stubs may point into the new object.
+        for stub in [m for m in self.truncated if child.is_contain(m.value)]:
+            target = child.search_cmember(stub.value)
+            if target is not None:
+                stub.truncated = False
+                self.truncated.remove(stub)
+                stub.cobject.rows_changed()
+                stub.connect(target)
+        return child
+
+    def refresh(self):
+        """
+        Read every object again, e.g. after the debugger stepped.
+
+        Only changed objects are reported, with values_changed. Pointers
+        that changed are reconnected when they point to a known object,
+        and left as stubs otherwise, so nothing new is read.
+
+        :return: Number of changed objects.
+        """
+        count = 0
+        self.backend.prefetch(coalesce_ranges([(cobj.address, cobj.size) for cobj in self.cobjects], self.read_gap))
+        for cobj in list(self.cobjects):
+            raw = self.backend.read(cobj.address, cobj.size)
+            if raw is None or len(raw) != cobj.size or raw == cobj.raw:
+                continue
+            old_rows = cobj.rows
+            old_labels = [str(member) for member in cobj.members]
+            links = []
+            for member in cobj.reload(raw):
+                if member.connected_cobject is not None:
+                    member.connected_cobject = None
+                    self.listener.edge_removed(cobj, old_labels[member.idx])
+                if member.truncated:
+                    member.truncated = False
+                    self.truncated.remove(member)
+                if member.is_valid_ptr:
+                    if self.is_contain(member.value):
+                        links.append(member)
+                    elif self.pointee_layout(member.ptr_struct_name) is not None:
+                        member.truncated = True
+                        self.truncated.append(member)
+            self._values_changed(cobj, old_rows)
+            for member in links:
+                self.link(member)
+            count += 1
+
+        for clist in self.clists.values():
+            old_rows = clist.rows
+            # The chain is walked again, its old elements must not stop it.
+            self._unindex_elements(clist)
+            clist.reload()
+            self._index_elements(clist)
+            if self._values_changed(clist, old_rows):
+                count += 1
+        return count
+
+    def _values_changed(self, obj, old_rows):
+        rows = obj.rows
+        if rows == old_rows:
+            return False
+        old_labels = set(row.label for row in old_rows)
+        self.listener.values_changed(obj, rows, [row.label for row in rows if row.label not in old_labels])
+        return True
+
+    def on_attr_scrolled(self, node_name, attr_name, steps):
+        """
+        Scroll the array window under the mouse.
+
+        """
+        if node_name in self.nodes:
+            self.nodes[node_name].on_attr_scrolled(attr_name, steps)
+
+    def on_attr_double_clicked(self, node_name, attr_name):
+        """
+        Expand the stub behind a double clicked attribute, or turn the page
+        of a list.
+
+        """
+        if node_name in self.clists:
+            clist = self.clists[node_name]
+            clist.on_attr_double_clicked(attr_name)
+            # Turning the page may have walked more elements.
+            self._index_elements(clist)
+            return
+        for member in self.truncated:
+            if str(member.cobject) == node_name and str(member) == attr_name:
+                self.expand(member)
+                return
+
+    def search_cmember(self, address):
+        obj = self.search_cobject(address)
+        return obj.search_cmember(address)
+
+    def link(self, member):
+        """
+        Connect member to the known object or list it points into. A list
+        element is reached through the header row of its list.
+
+        :param member: Pointer CMember whose value is_contain.
+        """
+        clist = self.search_clist(member.value)
+        if clist is not None:
+            clist.attach(member)
+            return
+        target = self.search_cmember(member.value)
+        if target is not None:
+            member.connect(target)
+
+    def search_cobject(self, address):
+        """
+
+        :param address: Memory address.
+        :return: CObject which contains the address, or None.
+        """
+        return self._cobject_index.search(address)
+
+    def _index_elements(self, clist):
+        """
+        Add the elements of clist walked since the last call to the index.
+
+        """
+        start = self._indexed_elements.get(clist, 0)
+        for address in clist.addresses[start:]:
+            self._element_index.insert(address, clist.size, clist)
+        self._indexed_elements[clist] = len(clist.addresses)
+
+    def _unindex_elements(self, clist):
+        self._element_index.remove(clist)
+        self._indexed_elements[clist] = 0
+
+    def search_clist(self, address):
+        """
+
+        :param address: Memory address.
+        :return: CList with an element which contains the address, or None.
+        """
+        return self._element_index.search(address)
+
+    def is_contain(self, address):
+        """
+
+        :param address: Memory address.
+        :return: True when object or list element with specified address
+                 already added.
+        """
+        return self.search_cobject(address) is not None or self.search_clist(address) is not None
+
+
+"""
+Snapshot file, all integers little-endian:
+
+    header  magic, bits, flags (1: big endian), root address, index offset
+    data    bytes of every range, back to back
+    index   max depth, list min length, root struct name,
+            ranges (address, size, data offset) sorted by address,
+            structs (name, size, is_union, members),
+            objects (address, struct, parent object, parent member),
+            lists (parent object, parent member),
+            edges (object, member),
+            stubs (object, member)
+
+Objects are in the order they were added, so a parent comes before its
+children. An object is its index in the objects, -1 for none, and a
+member its index in the object.
+
+Strings are a u16 length and utf-8 bytes, 0xffff meaning None.
+"""
+_snapshot_magic = b'IOVSNAP2'
+_snapshot_header = struct.Struct('<8sIIQQ')
+_snapshot_range = struct.Struct('<QQQ')
+_snapshot_struct = struct.Struct('<QBI')
+_snapshot_member = struct.Struct('<QQQQBBQq')
+_snapshot_object = struct.Struct('<QIiI')
+_snapshot_ref = struct.Struct('<II')
+
+# Graph of a snapshot, rebuilt by CObjectManager.restore.
+# objects: (address, struct name, (parent object, parent member) or None)
+# lists, edges, truncated: (object, member) of the list heads, the
+# connected pointers and the stubs.
+SavedGraph = namedtuple('SavedGraph', ['objects', 'lists', 'edges', 'truncated', 'list_min_length'])
+
+def _pack_str(text):
+    if text is None:
+        return struct.pack('<H', 0xffff)
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+    return struct.pack('<H', len(text)) + text
+
+def _pack_count(count):
+    return struct.pack('<I', count)
+
+
+class _SnapshotReader(object):
+
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+
+    def unpack(self, fmt):
+        values = fmt.unpack_from(self.data, self.offset)
+        self.offset += fmt.size
+        return values
+
+    def count(self):
+        count = struct.unpack_from('<I', self.data, self.offset)[0]
+        self.offset += 4
+        return count
+
+    def str(self):
+        length = struct.unpack_from('<H', self.data, self.offset)[0]
+        self.offset += 2
+        if length == 0xffff:
+            return None
+        text = self.data[self.offset:self.offset + length]
+        self.offset += length
+        # Keep native strings, bytes on Python 2.
+        return text if isinstance(text, str) else text.decode('utf-8')
+
+
+def save_snapshot(cmanager, path):
+    """
+    Write the objects of cmanager to a snapshot file.
+
+    Saved are the bytes of every object and list element, the layouts of
+    their structures and the graph: objects, lists, edges and stubs.
+    SnapshotBackend reopens it.
+
+    :param cmanager: Built CObjectManager.
+    :type  cmanager: CObjectManager.
+
+    :param path: File to write.
+    :type  path: Str.
+
+    """
+    backend = cmanager.backend
+    chunks = [(cobj.address, cobj.raw) for cobj in cmanager.cobjects]
+    for clist in cmanager.clists.values():
+        for address in clist.addresses:
+            raw = backend.read(address, clist.size)
+            if raw is not None and len(raw) == clist.size:
+                chunks.append((address, raw))
+
+    # Overlapping or adjacent objects share a range.
+    ranges = []
+    for address, size in coalesce_ranges([(address, len(raw)) for address, raw in chunks], 0, max_size=1 << 64):
+        ranges.append((address, bytearray(size)))
+    starts = [address for address, data in ranges]
+    for address, raw in chunks:
+        start, data = ranges[bisect.bisect_right(starts, address) - 1]
+        data[address - start:address - start + len(raw)] = raw
+
+    # Structures in use, and those of their struct arrays.
+    names = dict()
+    for obj in list(cmanager.cobjects) + list(cmanager.clists.values()):
+        names[obj.layout.struct_id] = obj.struct_name
+    order = list(names)
+    ids = dict((struct_id, i) for i, struct_id in enumerate(order))
+    layouts = []
+    while len(layouts) < len(order):
+        layout = backend.struct_layout(order[len(layouts)])
+        layouts.append(layout)
+        for member in layout.members:
+            if member.element_struct_id is not None and member.element_struct_id not in ids:
+                ids[member.element_struct_id] = len(order)
+                order.append(member.element_struct_id)
+
+    # Objects by their index in the file.
+    indices = dict((cobj, i) for i, cobj in enumerate(cmanager.cobjects))
+
+    def ref(member):
+        return _snapshot_ref.pack(indices[member.cobject], member.idx)
+
+    objects = []
+    edges = []
+    for cobj in cmanager.cobjects:
+        parent = cobj.parent_cmember
+        objects.append(_snapshot_object.pack(cobj.address, ids[cobj.layout.struct_id],
+                                             -1 if parent is None else indices[parent.cobject],
+                                             0 if parent is None else parent.idx))
+        edges.extend(ref(member) for member in cobj.members if member.connected_cobject is not None)
+
+    index = [struct.pack('<I', max([0] + [cobj.depth for cobj in cmanager.cobjects])),
+             _pack_count(cmanager.list_min_length),
+             _pack_str(cmanager.cobjects[0].struct_name if cmanager.cobjects else None),
+             _pack_count(len(ranges))]
+    with open(path, 'wb') as f:
+        f.write(_snapshot_header.pack(_snapshot_magic, 0, 0, 0, 0))
+        for address, data in ranges:
+            index.append(_snapshot_range.pack(address, len(data), f.tell()))
+            f.write(bytes(data))
+
+        index.append(_pack_count(len(layouts)))
+        for struct_id, layout in zip(order, layouts):
+            index.append(_pack_str(names.get(struct_id)))
+            index.append(_snapshot_struct.pack(layout.size, layout.is_union, len(layout.members)))
+            for m in layout.members:
+                index.append(_snapshot_member.pack(m.offset, m.size, m.flag, m.member_id, m.is_ptr, m.is_scalar,
+                                                   m.element_size or 0,
+                                                   -1 if m.element_struct_id is None else ids[m.element_struct_id]))
+                index.append(_pack_str(m.name) + _pack_str(m.type) + _pack_str(m.ptr_struct_name))
+        index.append(_pack_count(len(objects)))
+        index.extend(objects)
+        index.append(_pack_count(len(cmanager.clists)))
+        index.extend(ref(clist.parent_cmember) for clist in cmanager.clists.values())
+        index.append(_pack_count(len(edges)))
+        index.extend(edges)
+        index.append(_pack_count(len(cmanager.truncated)))
+        index.extend(ref(member) for member in cmanager.truncated)
+
+        index_offset = f.tell()
+        f.write(b''.join(index))
+        f.seek(0)
+        f.write(_snapshot_header.pack(_snapshot_magic, backend.bits, 1 if backend.endian == 'big' else 0,
+                                      cmanager.main_address, index_offset))
+
+
+class SnapshotBackend(object):
+    """
+    Backend over a snapshot file written by save_snapshot.
+
+    The file is memory-mapped and only its index is parsed when opened. The
+    bytes of an object are copied when the object is read, and structures
+    are decoded on first use. Needs neither IDA nor a debugger. graph is
+    the SavedGraph to restore, close() unmaps the file.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.bits, flags, self.root_address, index_offset = _snapshot_header.unpack_from(self.data, 0)
+        if magic != _snapshot_magic:
+            self.close()
+            raise SnapshotException(path + ' isn\'t an object viewer snapshot of this version.')
+        self.endian = 'big' if flags & 1 else 'little'
+
+        reader = _SnapshotReader(self.data, index_offset)
+        self.max_depth = reader.count()
+        list_min_length = reader.count()
+        self.root_struct_name = reader.str()
+
+        count = reader.count()
+        ranges = struct.unpack_from('<' + 'Q' * (3 * count), self.data, reader.offset)
+        reader.offset += _snapshot_range.size * count
+        self.starts = ranges[0::3]
+        self.sizes = ranges[1::3]
+        self.offsets = ranges[2::3]
+
+        # Struct id (index in the file) -> (name, size, is_union, members)
+        self.structs = []
+        self.struct_ids = dict()
+        for struct_id in range(reader.count()):
+            name = reader.str()
+            size, is_union, member_count = reader.unpack(_snapshot_struct)
+            members = []
+            for i in range(member_count):
+                offset, msize, flag, member_id, is_ptr, is_scalar, element_size, element_struct_id = reader.unpack(_snapshot_member)
+                member_name = reader.str()
+                member_type = reader.str()
+                ptr_struct_name = reader.str()
+                members.append(MemberLayout(offset, member_name, msize, flag, member_id, member_type, bool(is_ptr),
+                                            bool(is_scalar), ptr_struct_name, element_size or None,
+                                            None if element_struct_id < 0 else element_struct_id))
+            self.structs.append((name, size, bool(is_union), members))
+            if name is not None:
+                self.struct_ids[name] = struct_id
+        self.layouts = dict()
+
+        objects = []
+        for i in range(reader.count()):
+            address, struct_id, parent, member = reader.unpack(_snapshot_object)
+            objects.append((address, self.structs[struct_id][0], None if parent < 0 else (parent, member)))
+        refs = []
+        for i in range(3):
+            refs.append([reader.unpack(_snapshot_ref) for j in range(reader.count())])
+        self.graph = SavedGraph(objects, refs[0], refs[1], refs[2], list_min_length)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def struct_id(self, struct_name):
+        return self.struct_ids.get(struct_name)
+
+    def struct_layout(self, struct_id):
+        layout = self.layouts.get(struct_id)
+        if layout is None:
+            name, size, is_union, members = self.structs[struct_id]
+            layout = StructLayout(struct_id, size, is_union, members, self.bits, self.endian)
+            self.layouts[struct_id] = layout
+        return layout
+
+    def _range(self, address, size):
+        i = bisect.bisect_right(self.starts, address) - 1
+        if i < 0 or address + size > self.starts[i] + self.sizes[i]:
+            return None
+        return i
+
+    def read(self, address, size):
+        i = self._range(address, size)
+        if i is None:
+            return None
+        offset = self.offsets[i] + address - self.starts[i]
+        return self.data[offset:offset + size]
+
+    def is_mapped(self, address):
+        return self._range(address, 1) is not None
+
+    def prefetch(self, ranges):
+        pass
+
+    def invalidate(self):
+        # A snapshot never changes.
+        pass
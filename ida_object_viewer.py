@@ -1,21 +1,44 @@
 from PyQt5 import QtGui, QtCore, QtWidgets
-import struct
+import os
+import sys
+import math
+import threading
+import time
+import heapq
+from collections import deque
 import idaapi
 import ida_kernwin
 import idc
-import idautils
-import re
+
+# The model lives next to this plugin.
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from ida_object_model import (CObjectManager, GraphListener, SyncedIDABackend, CachedBackend, SnapshotBackend, save_snapshot,
+                              invalidate_struct_layouts, layered_layout, NotDefinedObjectException, MemoryReadException, SnapshotException)
 
 nodz = None
+cmanager = None
+graph_view = None
+graph_loader = None
 max_depth = 2 #TEMP
+max_nodes = 300
+max_bytes = 0x100000
+list_min_length = 4
+list_page_size = 16
+array_window = 8
+# Memory is read and cached by pages of this size.
+read_cache_page_size = 0x1000
+# Cached bytes at most.
+read_cache_size = 0x1000000
+# Objects of one traversal level closer than this are read at once.
+read_gap = 0x1000
+# Refresh the view when the debugger suspends or steps.
+live_refresh = True
+# Attribute preset of the rows changed by the last refresh.
+highlight_preset = 'attr_preset_2'
+# 'layered' to lay out the whole graph by depth, 'tree' to stack subtrees.
+graph_layout = 'layered'
 #TODO hook debugger activate event?
 dbg_active = False
-"""
-struct struc_1 -> struc_1
-struc_1 ->  struc_1
-"""
-pattern = '^[ ]*(struct[ ]+)?'
-pat = re.compile(pattern)
 bits = 0
 endian = 'little'
 
@@ -84,6 +107,74 @@ def generateAlternateColorMultiplier(color, av):
 
     return mult
 
+class PresetStyles(object):
+    """
+    Colors, brushes and pens of the attribute presets of a config, built
+    once and shared by every node and slot of the view.
+
+    """
+
+    def __init__(self, config):
+        """
+        Initialize the class.
+
+        :param config: Configuration of the view.
+        :type  config: Dict.
+
+        """
+        self.config = config
+        self.attrs = dict()
+        for name, preset in config.items():
+            if isinstance(preset, dict) and 'bg' in preset and 'text' in preset and 'border' not in preset:
+                self.attrs[name] = self._attrStyle(preset)
+
+        # Row outline, transparent.
+        self.rowPen = QtGui.QPen()
+        self.rowPen.setStyle(QtCore.Qt.SolidLine)
+        self.rowPen.setColor(convertDataToColor([0, 0, 0, 0]))
+
+        self.slotPen = QtGui.QPen()
+        self.slotPen.setStyle(QtCore.Qt.SolidLine)
+
+        self.validSlotPen = QtGui.QPen()
+        self.validSlotPen.setStyle(QtCore.Qt.SolidLine)
+        self.validSlotPen.setWidth(2)
+        self.validSlotPen.setColor(QtGui.QColor(255, 255, 255, 255))
+
+        # Level of detail (on-screen scale) under which labels, then rows,
+        # slots and curves are not drawn.
+        self.lodText = config['lod_text']
+        self.lodDetail = config['lod_detail']
+
+        nonConnectable = convertDataToColor(config['non_connectable_color'])
+        self.nonConnectablePen = QtGui.QPen(nonConnectable)
+        self.nonConnectableBrush = QtGui.QBrush(nonConnectable)
+
+    def _attrStyle(self, preset):
+        """
+
+        :return: Dict of the QBrush and QPen objects of one attribute preset.
+        """
+        style = dict()
+        style['bg'] = QtGui.QBrush(convertDataToColor(preset['bg']))
+        style['bg_alt'] = QtGui.QBrush(convertDataToColor(preset['bg'], True, self.config['alternate_value']))
+        style['text'] = QtGui.QPen(convertDataToColor(preset['text']))
+        for slot in ('plug', 'socket'):
+            if slot in preset:
+                style[slot] = QtGui.QBrush(convertDataToColor(preset[slot]))
+        return style
+
+    def attr(self, name):
+        """
+
+        :return: Style of the attribute preset name.
+        """
+        style = self.attrs.get(name)
+        if style is None:
+            # Presets added to the config afterwards.
+            style = self.attrs[name] = self._attrStyle(self.config[name])
+        return style
+
 def createPointerBoundingBox(pointerPos, bbSize):
     """
     generate a bounding box around the pointer.
@@ -171,9 +262,20 @@ class Nodz(QtWidgets.QGraphicsView):
     signal_GraphLoaded = QtCore.pyqtSignal()
     signal_GraphCleared = QtCore.pyqtSignal()
     signal_GraphEvaluated = QtCore.pyqtSignal()
+    signal_Closed = QtCore.pyqtSignal()
 
     signal_KeyPressed = QtCore.pyqtSignal(object)
     signal_Dropped = QtCore.pyqtSignal()
+    signal_AttrDoubleClicked = QtCore.pyqtSignal(object, object)
+    signal_AttrScrolled = QtCore.pyqtSignal(object, object, object)
+
+    # Render profile -> (viewport update mode, node cache mode,
+    # antialiasing while zooming or dragging).
+    renderProfiles = {
+        'full': (QtWidgets.QGraphicsView.FullViewportUpdate, QtWidgets.QGraphicsItem.NoCache, True),
+        'smart': (QtWidgets.QGraphicsView.SmartViewportUpdate, QtWidgets.QGraphicsItem.DeviceCoordinateCache, False),
+        'minimal': (QtWidgets.QGraphicsView.MinimalViewportUpdate, QtWidgets.QGraphicsItem.DeviceCoordinateCache, False),
+    }
 
     def __init__(self, parent, config_s):
         """
@@ -188,6 +290,8 @@ class Nodz(QtWidgets.QGraphicsView):
         # General data.
         self.gridVisToggle = True
         self.gridSnapToggle = False
+        # False while zoomed out below lod_detail.
+        self.slotsVisible = True
         self._nodeSnap = False
         self.selectedNodes = None
 
@@ -203,9 +307,26 @@ class Nodz(QtWidgets.QGraphicsView):
 
     def wheelEvent(self, event):
         """
-        Zoom in the view with the mouse wheel.
+        Zoom in the view with the mouse wheel, or scroll a scrollable
+        attribute under the mouse.
 
         """
+        self._beginInteraction()
+        # Zooming ends with the last wheel event.
+        self._interactionTimer.start()
+
+        item = self.itemAt(event.pos())
+        if isinstance(item, SlotItem):
+            item = item.parentItem()
+        if isinstance(item, NodeItem):
+            attr = item.attrAt(item.mapFromScene(self.mapToScene(event.pos())))
+            if attr is not None and item.attrsData[attr]['scrollable']:
+                if event.delta() > 0:
+                    self.signal_AttrScrolled.emit(item.name, attr, -1)
+                else:
+                    self.signal_AttrScrolled.emit(item.name, attr, 1)
+                return
+
         self.currentState = 'ZOOM_VIEW'
         self.setTransformationAnchor(QtWidgets.QGraphicsView.AnchorUnderMouse)
 
@@ -218,6 +339,7 @@ class Nodz(QtWidgets.QGraphicsView):
             zoomFactor = outFactor
 
         self.scale(zoomFactor, zoomFactor)
+        self._updateDetail()
         self.currentState = 'DEFAULT'
 
     def mousePressEvent(self, event):
@@ -225,6 +347,8 @@ class Nodz(QtWidgets.QGraphicsView):
         Initialize tablet zoom, drag canvas and the selection.
 
         """
+        self._beginInteraction()
+
         # Tablet zoom
         if (event.button() == QtCore.Qt.RightButton and
             event.modifiers() == QtCore.Qt.AltModifier):
@@ -326,6 +450,7 @@ class Nodz(QtWidgets.QGraphicsView):
             pBefore = self.mapToScene(self.initMousePos)
             self.setTransformationAnchor(QtWidgets.QGraphicsView.AnchorViewCenter)
             self.scale(zoomFactor, zoomFactor)
+            self._updateDetail()
             pAfter = self.mapToScene(self.initMousePos)
             diff = pAfter - pBefore
 
@@ -353,6 +478,8 @@ class Nodz(QtWidgets.QGraphicsView):
         Apply tablet zoom, dragging and selection.
 
         """
+        self._endInteraction()
+
         # Zoom the View.
         if self.currentState == '.ZOOM_VIEW':
             self.offset = 0
@@ -449,6 +576,65 @@ class Nodz(QtWidgets.QGraphicsView):
         if event.key() in self.pressedKeys:
             self.pressedKeys.remove(event.key())
 
+    def closeEvent(self, event):
+        """
+        Tell the owner the window is closed.
+
+        """
+        # Emit signal.
+        self.signal_Closed.emit()
+
+        super(Nodz, self).closeEvent(event)
+
+    def _setAntialiasing(self, enabled):
+        """
+        Turn the antialiasing hints of the config on, or all of them off.
+
+        """
+        config = self.config
+        self.setRenderHint(QtGui.QPainter.Antialiasing, enabled and config['antialiasing'])
+        self.setRenderHint(QtGui.QPainter.TextAntialiasing, enabled and config['antialiasing'])
+        self.setRenderHint(QtGui.QPainter.HighQualityAntialiasing, enabled and config['antialiasing_boost'])
+
+    def _beginInteraction(self):
+        """
+        Drop antialiasing while the view is zoomed or dragged, if the
+        render profile asks for it.
+
+        """
+        if not self.renderProfile[2] and not self.interacting:
+            self.interacting = True
+            self._setAntialiasing(False)
+
+    def _endInteraction(self):
+        """
+        Restore antialiasing after an interaction, and repaint the nodes
+        cached without it. Qt keeps item caches when render hints change.
+
+        """
+        if self.interacting:
+            self.interacting = False
+            self._setAntialiasing(True)
+            for node in self.aliasedNodes:
+                if node.scene() is not None:
+                    node.update()
+            self.aliasedNodes.clear()
+
+    def setHoveredNode(self, node):
+        """
+        Change the node hovered while a connection is drawn, and repaint
+        the nodes that change color.
+
+        """
+        if node is self.currentHoveredNode:
+            return
+        for item in (self.currentHoveredNode, node):
+            if item is not None and item.scene() is not None:
+                item.update()
+                for slot in item.plugs.values() + item.sockets.values():
+                    slot.update()
+        self.currentHoveredNode = node
+
     def _initRubberband(self, position):
         """
         Initialize the rubber band at the given position.
@@ -481,6 +667,20 @@ class Nodz(QtWidgets.QGraphicsView):
         else:
             itemsArea = self.scene().itemsBoundingRect()
             self.fitInView(itemsArea, QtCore.Qt.KeepAspectRatio)
+        self._updateDetail()
+
+    def _updateDetail(self):
+        """
+        Hide the slots when zoomed out below lod_detail, where they are
+        not drawn anyway, so the scene stops visiting them.
+
+        """
+        visible = self.transform().m11() >= self.styles.lodDetail
+        if visible != self.slotsVisible:
+            self.slotsVisible = visible
+            for node in self.scene().nodes.values():
+                for slot in node.plugs.values() + node.sockets.values():
+                    slot.setVisible(visible)
 
     def _getSelectionBoundingbox(self):
         """
@@ -573,6 +773,7 @@ class Nodz(QtWidgets.QGraphicsView):
 
         """
         self.config = d
+        self.styles = PresetStyles(d)
 
     def initialize(self):
         """
@@ -581,12 +782,19 @@ class Nodz(QtWidgets.QGraphicsView):
         """
         # Setup view.
         config = self.config
-        self.setRenderHint(QtGui.QPainter.Antialiasing, config['antialiasing'])
-        self.setRenderHint(QtGui.QPainter.TextAntialiasing, config['antialiasing'])
-        self.setRenderHint(QtGui.QPainter.HighQualityAntialiasing, config['antialiasing_boost'])
+        self.renderProfile = self.renderProfiles[config['render_profile']]
+        self.interacting = False
+        # Nodes painted while antialiasing was off.
+        self.aliasedNodes = set()
+        self._interactionTimer = QtCore.QTimer(self)
+        self._interactionTimer.setSingleShot(True)
+        self._interactionTimer.setInterval(200)
+        self._interactionTimer.timeout.connect(self._endInteraction)
+
+        self._setAntialiasing(True)
         self.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, config['smooth_pixmap'])
         self.setRenderHint(QtGui.QPainter.NonCosmeticDefaultPen, True)
-        self.setViewportUpdateMode(QtWidgets.QGraphicsView.FullViewportUpdate)
+        self.setViewportUpdateMode(self.renderProfile[0])
         self.setTransformationAnchor(QtWidgets.QGraphicsView.AnchorUnderMouse)
         self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
         self.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
@@ -643,6 +851,7 @@ class Nodz(QtWidgets.QGraphicsView):
         else:
             nodeItem = NodeItem(name=name, alternate=alternate, preset=preset,
                                 config=self.config)
+            nodeItem.setCacheMode(self.renderProfile[1])
 
             # Store node in scene.
             self.scene().nodes[name] = nodeItem
@@ -733,7 +942,7 @@ class Nodz(QtWidgets.QGraphicsView):
 
 
     # ATTRS
-    def createAttribute(self, node, name='default', index=-1, preset='attr_default', plug=True, socket=True, dataType=None):
+    def createAttribute(self, node, name='default', index=-1, preset='attr_default', plug=True, socket=True, dataType=None, scrollable=False):
         """
         Create a new attribute with a given name.
 
@@ -763,6 +972,11 @@ class Nodz(QtWidgets.QGraphicsView):
                          in order to highlight attributes of the same
                          type while performing a connection.
 
+        :type  scrollable: bool.
+        :param scrollable: Whether or not the mouse wheel over this
+                           attribute emits signal_AttrScrolled instead
+                           of zooming.
+
         """
         if not node in self.scene().nodes.values():
             print 'Node object does not exist !'
@@ -774,7 +988,11 @@ class Nodz(QtWidgets.QGraphicsView):
             print 'Attribute creation aborted !'
             return
 
-        node._createAttribute(name=name, index=index, preset=preset, plug=plug, socket=socket, dataType=dataType)
+        node._createAttribute(name=name, index=index, preset=preset, plug=plug, socket=socket, dataType=dataType, scrollable=scrollable)
+        if not self.slotsVisible:
+            for slots in (node.plugs, node.sockets):
+                if name in slots:
+                    slots[name].setVisible(False)
 
         # Emit signal.
         self.signal_AttrCreated.emit(node.name, index)
@@ -800,7 +1018,7 @@ class Nodz(QtWidgets.QGraphicsView):
         # Emit signal.
         self.signal_AttrDeleted.emit(node.name, index)
 
-    def editAttribute(self, node, index, newName=None, newIndex=None):
+    def editAttribute(self, node, index, newName=None, newIndex=None, newPreset=None):
         """
         Edit the specified attribute.
 
@@ -816,12 +1034,19 @@ class Nodz(QtWidgets.QGraphicsView):
         :type  newIndex: int.
         :param newIndex: The index for the given attribute.
 
+        :type  newPreset: str.
+        :param newPreset: The name of the new graphical preset in the
+                          config file.
+
         """
         if not node in self.scene().nodes.values():
             print 'Node object does not exist !'
             print 'Attribute creation aborted !'
             return
 
+        if newPreset != None:
+            node.attrsData[node.attrs[index]]['preset'] = newPreset
+
         if newName != None:
             if newName in node.attrs:
                 print 'An attribute with the same name already exists : {0}'.format(newName)
@@ -851,10 +1076,16 @@ class Nodz(QtWidgets.QGraphicsView):
             node.attrsData.pop(oldName)
             node.attrs[index] = newName
 
+            node._attrWidths.pop(oldName)
+            node._measureAttribute(newName)
+            node._updateSize()
+
         if isinstance(newIndex, int):
             attrName = node.attrs[index]
 
+            node._prepareRowsChange(min(index, newIndex))
             swapListIndices(node.attrs, index, newIndex)
+            node._updateSize()
 
             # Refresh connections.
             for plug in node.plugs.values():
@@ -928,6 +1159,7 @@ class Nodz(QtWidgets.QGraphicsView):
         connection.updatePath()
 
         self.scene().addItem(connection)
+        self.scene().connections.add(connection)
 
         return connection
 
@@ -941,11 +1173,8 @@ class Nodz(QtWidgets.QGraphicsView):
 
         data = list()
 
-        for item in scene.items():
-            if isinstance(item, ConnectionItem):
-                connection = item
-
-                data.append(connection._outputConnectionData())
+        for connection in scene.connections:
+            data.append(connection._outputConnectionData())
 
         # Emit Signal
         self.signal_GraphEvaluated.emit()
@@ -959,6 +1188,9 @@ class Nodz(QtWidgets.QGraphicsView):
         """
         self.scene().clear()
         self.scene().nodes = dict()
+        self.scene().connections = set()
+        self.scene().raisedNode = None
+        self.aliasedNodes.clear()
 
         # Emit signal.
         self.signal_GraphCleared.emit()
@@ -985,9 +1217,29 @@ class NodeScene(QtWidgets.QGraphicsScene):
 
         # General.
         self.gridSize = parent.config['grid_size']
+        self.gridMinSpacing = parent.config['grid_min_spacing']
+
+        self._gridPen = QtGui.QPen()
+        self._gridPen.setColor(convertDataToColor(parent.config['grid_color']))
+        self._gridPen.setWidth(0)
+        # Largest grid tile, in pixels. Lines further apart are drawn directly.
+        self._gridTileSize = 512
+        # (line spacing in pixels, texture brush) of the current and the
+        # previous zoom levels.
+        self._gridBrushes = []
 
         # Nodes storage.
         self.nodes = dict()
+        # Established connections.
+        self.connections = set()
+        # Node drawn above the others, the last one clicked.
+        self.raisedNode = None
+
+        # Nodes whose slots moved since their connections were updated.
+        self._movedNodes = set()
+        self._connectionsTimer = QtCore.QTimer(self)
+        self._connectionsTimer.setSingleShot(True)
+        self._connectionsTimer.timeout.connect(self.updateMovedConnections)
 
     def dragEnterEvent(self, event):
         """
@@ -1019,35 +1271,135 @@ class NodeScene(QtWidgets.QGraphicsScene):
         """
         Draw a grid in the background.
 
+        The grid is filled with a cached tile, in device pixels so lines
+        stay sharp. When zoomed out, every other line is skipped until
+        lines are at least grid_min_spacing pixels apart.
+
         """
         if self.views()[0].gridVisToggle:
-            leftLine = rect.left() - rect.left() % self.gridSize
-            topLine = rect.top() - rect.top() % self.gridSize
-            lines = list()
-
-            i = int(leftLine)
-            while i < int(rect.right()):
-                lines.append(QtCore.QLineF(i, rect.top(), i, rect.bottom()))
-                i += self.gridSize
-
-            u = int(topLine)
-            while u < int(rect.bottom()):
-                lines.append(QtCore.QLineF(rect.left(), u, rect.right(), u))
-                u += self.gridSize
-
-            self.pen = QtGui.QPen()
-            config = self.parent().config
-            self.pen.setColor(convertDataToColor(config['grid_color']))
-            self.pen.setWidth(0)
-            painter.setPen(self.pen)
-            painter.drawLines(lines)
+            transform = painter.worldTransform()
+            step = self.gridSize
+            while step * transform.m11() < self.gridMinSpacing:
+                step *= 2
+            if step * transform.m11() > self._gridTileSize:
+                # Zoomed in so far that only a few lines are visible.
+                self._drawGridLines(painter, rect, step)
+                return
+            brush = self._gridBrush(step * transform.m11())
+
+            # Start the tiles on the grid line at the top left of the view,
+            # the same for every exposed area.
+            corner = self.views()[0].mapToScene(0, 0)
+            origin = transform.map(QtCore.QPointF(math.floor(corner.x() / step) * step,
+                                                  math.floor(corner.y() / step) * step))
+            brush.setTransform(QtGui.QTransform.fromTranslate(round(origin.x()), round(origin.y())))
+
+            painter.save()
+            painter.resetTransform()
+            painter.fillRect(transform.mapRect(rect), brush)
+            painter.restore()
+
+    def _drawGridLines(self, painter, rect, step):
+        """
+        Draw the grid lines crossing rect one by one, on whole device
+        pixels like the tiles.
+
+        :param step: Distance between lines, in scene units.
+        :type  step: Int.
+
+        """
+        transform = painter.worldTransform()
+        area = transform.mapRect(rect)
+        lines = list()
+
+        i = rect.left() - rect.left() % step
+        while i < rect.right():
+            x = round(transform.map(QtCore.QPointF(i, 0)).x())
+            lines.append(QtCore.QLineF(x, area.top(), x, area.bottom()))
+            i += step
+
+        u = rect.top() - rect.top() % step
+        while u < rect.bottom():
+            y = round(transform.map(QtCore.QPointF(0, u)).y())
+            lines.append(QtCore.QLineF(area.left(), y, area.right(), y))
+            u += step
+
+        painter.save()
+        painter.resetTransform()
+        painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
+        painter.setPen(self._gridPen)
+        painter.drawLines(lines)
+        painter.restore()
+
+    def _gridBrush(self, spacing):
+        """
+        The tile holds as many cells (up to 16, within _gridTileSize
+        pixels) as needed for its size to be close to a whole number of
+        pixels, so the lines barely drift from one tile to the next.
+
+        :param spacing: Distance between lines, in pixels.
+        :type  spacing: Float.
+
+        :return: Texture brush of the grid.
+        """
+        key = round(spacing, 3)
+        for cachedKey, brush in self._gridBrushes:
+            if cachedKey == key:
+                return brush
+
+        maxCells = max(1, min(16, int(self._gridTileSize // spacing)))
+        cells = min(range(1, maxCells + 1), key=lambda count: abs(count * spacing - round(count * spacing)))
+        size = int(round(cells * spacing))
+        tile = QtGui.QPixmap(size, size)
+        tile.fill(QtCore.Qt.transparent)
+        tilePainter = QtGui.QPainter(tile)
+        tilePainter.setPen(self._gridPen)
+        for cell in range(cells):
+            line = int(round(cell * spacing))
+            tilePainter.drawLine(line, 0, line, size - 1)
+            tilePainter.drawLine(0, line, size - 1, line)
+        tilePainter.end()
+
+        brush = QtGui.QBrush(tile)
+        # Zooming back and forth reuses the previous tile, older ones are freed.
+        self._gridBrushes = self._gridBrushes[-1:] + [(key, brush)]
+        return brush
 
     def updateScene(self):
         """
         Update the connections position.
 
         """
-        for connection in [i for i in self.items() if isinstance(i, ConnectionItem)]:
+        for connection in self.connections:
+            connection.target_point = connection.target.center()
+            connection.source_point = connection.source.center()
+            connection.updatePath()
+
+    def nodeMoved(self, node):
+        """
+        Queue the connections of node for the next update, done once per
+        pass of the event loop.
+
+        """
+        self._movedNodes.add(node)
+        if not self._connectionsTimer.isActive():
+            self._connectionsTimer.start(0)
+
+    def updateMovedConnections(self):
+        """
+        Update the connections of the queued nodes, each one once.
+
+        """
+        connections = set()
+        for node in self._movedNodes:
+            connections.update(node.connections)
+        self._movedNodes.clear()
+        self._connectionsTimer.stop()
+
+        for connection in connections:
+            if connection.source is None or connection.target is None:
+                # One end is being dragged.
+                continue
             connection.target_point = connection.target.center()
             connection.source_point = connection.source.center()
             connection.updatePath()
@@ -1095,6 +1447,10 @@ class NodeItem(QtWidgets.QGraphicsItem):
 
         self.plugs = dict()
         self.sockets = dict()
+        # Connections of all the plugs and sockets.
+        self.connections = set()
+        # Changes whenever the slots may have moved.
+        self.slotsGeneration = 0
 
         # Methods.
         self._createStyle(config)
@@ -1106,25 +1462,65 @@ class NodeItem(QtWidgets.QGraphicsItem):
         is created.
 
         """
-        if self.attrCount > 0:
-            return (self.baseHeight +
-                    self.attrHeight * self.attrCount +
-                    self.border +
-                    0.5 * self.radius)
-        else:
-            return self.baseHeight
+        return self._height
 
     @property
     def width(self):
         """
-        Calculate width dynamically.
-        :return:
+        Width of the widest attribute, at least the node width of the
+        config. Kept up to date by _updateSize.
+
+        """
+        return self._width
+
+    def _measureAttribute(self, name):
         """
+        Store the width needed by the label of an attribute.
 
-        w = self.baseWidth #min width
-        for attr in self.attrs:
-            w = max(w,self._attrFontMetrics.width(attr)+self.radius*2+self.border)
-        return w
+        """
+        self._attrWidths[name] = self._attrFontMetrics.width(name) + self.radius * 2 + self.border
+
+    def _prepareRowsChange(self, index):
+        """
+        Notify the scene before the rows from index down move, or the
+        node height changes.
+
+        """
+        self.prepareGeometryChange()
+        for name in self.attrs[index:]:
+            if name in self.plugs:
+                self.plugs[name].prepareGeometryChange()
+            if name in self.sockets:
+                self.sockets[name].prepareGeometryChange()
+
+    def _updateSize(self):
+        """
+        Recompute the width and height after attributes were created,
+        renamed or deleted.
+
+        """
+        width = max([self.baseWidth] + list(self._attrWidths.values()))
+        if width != self._width:
+            # Plugs sit on the right edge.
+            self.prepareGeometryChange()
+            for plug in self.plugs.values():
+                plug.prepareGeometryChange()
+            self._width = width
+
+        if self.attrCount > 0:
+            height = (self.baseHeight +
+                      self.attrHeight * self.attrCount +
+                      self.border +
+                      0.5 * self.radius)
+        else:
+            height = self.baseHeight
+        if height != self._height:
+            self.prepareGeometryChange()
+            self._height = height
+
+        self.slotsGeneration += 1
+        if self.connections:
+            self.scene().nodeMoved(self)
 
     @property
     def pen(self):
@@ -1145,6 +1541,7 @@ class NodeItem(QtWidgets.QGraphicsItem):
         self.setAcceptHoverEvents(True)
         self.setFlag(QtWidgets.QGraphicsItem.ItemIsMovable)
         self.setFlag(QtWidgets.QGraphicsItem.ItemIsSelectable)
+        self.setFlag(QtWidgets.QGraphicsItem.ItemSendsGeometryChanges)
 
         # Dimensions.
         self.baseWidth  = config['node_width']
@@ -1152,6 +1549,8 @@ class NodeItem(QtWidgets.QGraphicsItem):
         self.attrHeight = config['node_attr_height']
         self.border = config['node_border']
         self.radius = config['node_radius']
+        self._width = self.baseWidth
+        self._height = self.baseHeight
 
         self.nodeCenter = QtCore.QPointF()
         self.nodeCenter.setX(self.width / 2.0)
@@ -1176,19 +1575,15 @@ class NodeItem(QtWidgets.QGraphicsItem):
         self._textPen.setColor(convertDataToColor(config[self.nodePreset]['text']))
 
         self._nodeTextFont = QtGui.QFont(config['node_font'], config['node_font_size'], QtGui.QFont.Bold)
+        self._titleName = None
+        self._titleRect = None
         self._attrTextFont = QtGui.QFont(config['attr_font'], config['attr_font_size'], QtGui.QFont.Normal)
         self._attrFontMetrics = QtGui.QFontMetrics(self._attrTextFont)
+        # Label width of every attribute, measured once.
+        self._attrWidths = dict()
 
-        self._attrBrush = QtGui.QBrush()
-        self._attrBrush.setStyle(QtCore.Qt.SolidPattern)
 
-        self._attrBrushAlt = QtGui.QBrush()
-        self._attrBrushAlt.setStyle(QtCore.Qt.SolidPattern)
-
-        self._attrPen = QtGui.QPen()
-        self._attrPen.setStyle(QtCore.Qt.SolidLine)
-
-    def _createAttribute(self, name, index, preset, plug, socket, dataType):
+    def _createAttribute(self, name, index, preset, plug, socket, dataType, scrollable=False):
         """
         Create an attribute by expanding the node, adding a label and
         connection items.
@@ -1216,6 +1611,10 @@ class NodeItem(QtWidgets.QGraphicsItem):
                          in order to highlight attributes of the same
                          type while performing a connection.
 
+        :type  scrollable: bool.
+        :param scrollable: Whether or not the mouse wheel over this
+                           attribute scrolls it.
+
         """
         if name in self.attrs:
             print 'An attribute with the same name already exists on this node : {0}'.format(name)
@@ -1224,6 +1623,8 @@ class NodeItem(QtWidgets.QGraphicsItem):
 
         self.attrPreset = preset
 
+        self._prepareRowsChange(self.attrCount if index == -1 else index)
+
         # Create a plug connection item.
         if plug:
             plugInst = PlugItem(parent=self,
@@ -1256,9 +1657,12 @@ class NodeItem(QtWidgets.QGraphicsItem):
                                 'socket': socket,
                                 'plug': plug,
                                 'preset': preset,
-                                'dataType': dataType}
+                                'dataType': dataType,
+                                'scrollable': scrollable}
 
-        # Update node height.
+        # Update node size.
+        self._measureAttribute(name)
+        self._updateSize()
         self.update()
 
     def _deleteAttribute(self, index):
@@ -1271,6 +1675,7 @@ class NodeItem(QtWidgets.QGraphicsItem):
 
         """
         name = self.attrs[index]
+        self._prepareRowsChange(index)
 
         # Remove socket and its connections.
         if name in self.sockets.keys():
@@ -1295,7 +1700,9 @@ class NodeItem(QtWidgets.QGraphicsItem):
         # Remove attribute from node.
         if name in self.attrs:
             self.attrs.remove(name)
+        self._attrWidths.pop(name, None)
 
+        self._updateSize()
         self.update()
 
     def _remove(self):
@@ -1307,6 +1714,8 @@ class NodeItem(QtWidgets.QGraphicsItem):
 
         """
         self.scene().nodes.pop(self.name)
+        if self.scene().raisedNode is self:
+            self.scene().raisedNode = None
 
         # Remove all sockets connections.
         for socket in self.sockets.values():
@@ -1345,103 +1754,106 @@ class NodeItem(QtWidgets.QGraphicsItem):
         """
         Paint the node and attributes.
 
+        Zoomed out below lod_text, labels are left out. Below lod_detail,
+        the node is a plain box.
+
         """
+        nodzInst = self.scene().views()[0]
+        styles = nodzInst.styles
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        if nodzInst.interacting:
+            nodzInst.aliasedNodes.add(self)
+
         # Node base.
         painter.setBrush(self._brush)
         painter.setPen(self.pen)
 
+        if lod < styles.lodDetail:
+            painter.drawRect(0, 0, self.width, self.height)
+            return
+
         painter.drawRoundedRect(0, 0,
                                 self.width,
                                 self.height,
                                 self.radius,
                                 self.radius)
 
+        text = lod >= styles.lodText
+
         # Node label.
         painter.setPen(self._textPen)
         painter.setFont(self._nodeTextFont)
 
-        metrics = QtGui.QFontMetrics(painter.font())
-        text_width = metrics.boundingRect(self.name).width() + 14
-        text_height = metrics.boundingRect(self.name).height() + 14
-        margin = (text_width - self.baseWidth) * 0.5
-        textRect = QtCore.QRect(-margin,
-                                -text_height,
-                                text_width,
-                                text_height)
+        if self._titleName != self.name:
+            # Measured again only when the node is renamed.
+            metrics = QtGui.QFontMetrics(self._nodeTextFont)
+            text_width = metrics.boundingRect(self.name).width() + 14
+            text_height = metrics.boundingRect(self.name).height() + 14
+            margin = (text_width - self.baseWidth) * 0.5
+            self._titleRect = QtCore.QRect(-margin,
+                                           -text_height,
+                                           text_width,
+                                           text_height)
+            self._titleName = self.name
 
-        painter.drawText(textRect,
-                         QtCore.Qt.AlignCenter,
-                         self.name)
+        if text:
+            painter.drawText(self._titleRect,
+                             QtCore.Qt.AlignCenter,
+                             self.name)
 
 
         # Attributes.
-        offset = 0
-        for attr in self.attrs:
-            nodzInst = self.scene().views()[0]
-            config = nodzInst.config
-
-            # Attribute rect.
-            rect = QtCore.QRect(self.border / 2,
-                                self.baseHeight - self.radius + offset,
-                                self.width - self.border,
-                                self.attrHeight)
-
+        hovered = nodzInst.drawingConnection and self == nodzInst.currentHoveredNode
+        painter.setFont(self._attrTextFont)
 
+        # Rects reused by every row.
+        rect = QtCore.QRect(self.border / 2, 0, self.width - self.border, self.attrHeight)
+        textRect = QtCore.QRect(rect.left() + self.radius, 0, rect.width() - 2*self.radius, self.attrHeight)
 
+        for row, attr in enumerate(self.attrs):
             attrData = self.attrsData[attr]
-            name = attr
-
-            preset = attrData['preset']
+            style = styles.attr(attrData['preset'])
 
+            # Attribute rect.
+            rect.moveTop(self.baseHeight - self.radius + self.attrHeight * row)
+            textRect.moveTop(rect.top())
 
             # Attribute base.
-            self._attrBrush.setColor(convertDataToColor(config[preset]['bg']))
-            if self.alternate:
-                self._attrBrushAlt.setColor(convertDataToColor(config[preset]['bg'], True, config['alternate_value']))
-
-            self._attrPen.setColor(convertDataToColor([0, 0, 0, 0]))
-            painter.setPen(self._attrPen)
-            painter.setBrush(self._attrBrush)
-            if (offset / self.attrHeight) % 2:
-                painter.setBrush(self._attrBrushAlt)
+            painter.setPen(styles.rowPen)
+            if self.alternate and row % 2:
+                painter.setBrush(style['bg_alt'])
+            else:
+                painter.setBrush(style['bg'])
 
             painter.drawRect(rect)
 
+            if not text:
+                continue
+
             # Attribute label.
-            painter.setPen(convertDataToColor(config[preset]['text']))
-            painter.setFont(self._attrTextFont)
+            painter.setPen(style['text'])
 
             # Search non-connectable attributes.
-            if nodzInst.drawingConnection:
-                if self == nodzInst.currentHoveredNode:
-                    if (attrData['dataType'] != nodzInst.sourceSlot.dataType or
-                        (nodzInst.sourceSlot.slotType == 'plug' and attrData['socket'] == False or
-                         nodzInst.sourceSlot.slotType == 'socket' and attrData['plug'] == False)):
-                        # Set non-connectable attributes color.
-                        painter.setPen(convertDataToColor(config['non_connectable_color']))
-
-            textRect = QtCore.QRect(rect.left() + self.radius,
-                                     rect.top(),
-                                     rect.width() - 2*self.radius,
-                                     rect.height())
-            painter.drawText(textRect, QtCore.Qt.AlignVCenter, name)
-
-            offset += self.attrHeight
+            if hovered:
+                if (attrData['dataType'] != nodzInst.sourceSlot.dataType or
+                    (nodzInst.sourceSlot.slotType == 'plug' and attrData['socket'] == False or
+                     nodzInst.sourceSlot.slotType == 'socket' and attrData['plug'] == False)):
+                    # Set non-connectable attributes color.
+                    painter.setPen(styles.nonConnectablePen)
+
+            painter.drawText(textRect, QtCore.Qt.AlignVCenter, attr)
 
     def mousePressEvent(self, event):
         """
         Keep the selected node on top of the others.
 
         """
-        nodes = self.scene().nodes
-        for node in nodes.values():
-            node.setZValue(1)
-
-        for item in self.scene().items():
-            if isinstance(item, ConnectionItem):
-                item.setZValue(1)
-
-        self.setZValue(2)
+        scene = self.scene()
+        if scene.raisedNode is not self:
+            if scene.raisedNode is not None:
+                scene.raisedNode.setZValue(1)
+            self.setZValue(2)
+            scene.raisedNode = self
 
         super(NodeItem, self).mousePressEvent(event)
 
@@ -1461,12 +1873,21 @@ class NodeItem(QtWidgets.QGraphicsItem):
                 snap_y = (round(currentPos.y() / gridSize) * gridSize) - gridSize/4
                 snap_pos = QtCore.QPointF(snap_x, snap_y)
                 self.setPos(snap_pos)
-
-                self.scene().updateScene()
             else:
-                self.scene().updateScene()
                 super(NodeItem, self).mouseMoveEvent(event)
 
+            # Every selected node moved, update their connections at once.
+            self.scene().updateMovedConnections()
+
+    def itemChange(self, change, value):
+        """
+        Queue the connections of the node when it moves.
+
+        """
+        if change == QtWidgets.QGraphicsItem.ItemPositionHasChanged and self.scene() is not None:
+            self.scene().nodeMoved(self)
+        return super(NodeItem, self).itemChange(change, value)
+
     def mouseReleaseEvent(self, event):
         """
         .
@@ -1476,18 +1897,27 @@ class NodeItem(QtWidgets.QGraphicsItem):
         self.scene().signal_NodeMoved.emit(self.name, self.pos())
         super(NodeItem, self).mouseReleaseEvent(event)
 
-    def hoverLeaveEvent(self, event):
+    def attrAt(self, pos):
         """
-        .
+        Return the attribute at the given position in item coordinates,
+        or None.
 
         """
-        nodzInst = self.scene().views()[0]
+        index = int((pos.y() - self.baseHeight + self.radius) // self.attrHeight)
+        if 0 <= index < len(self.attrs):
+            return self.attrs[index]
+        return None
 
-        for item in nodzInst.scene().items():
-            if isinstance(item, ConnectionItem):
-                item.setZValue(0)
+    def mouseDoubleClickEvent(self, event):
+        """
+        Emit the double clicked attribute.
 
-        super(NodeItem, self).hoverLeaveEvent(event)
+        """
+        attr = self.attrAt(event.pos())
+        if event.button() == QtCore.Qt.LeftButton and attr is not None:
+            self.scene().views()[0].signal_AttrDoubleClicked.emit(self.name, attr)
+
+        super(NodeItem, self).mouseDoubleClickEvent(event)
 
 
 class SlotItem(QtWidgets.QGraphicsItem):
@@ -1529,12 +1959,13 @@ class SlotItem(QtWidgets.QGraphicsItem):
         self.index = index
         self.dataType = dataType
 
-        # Style.
-        self.brush = QtGui.QBrush()
-        self.brush.setStyle(QtCore.Qt.SolidPattern)
+        # Style, set by _createStyle.
+        self.brush = None
+        self.pen = None
 
-        self.pen = QtGui.QPen()
-        self.pen.setStyle(QtCore.Qt.SolidLine)
+        # Bounding rect, and the slotsGeneration of the node it is for.
+        self._rect = None
+        self._rectGeneration = None
 
         # Connections storage.
         self.connected_slots = list()
@@ -1580,9 +2011,9 @@ class SlotItem(QtWidgets.QGraphicsItem):
                 if self.parentItem() not in targets:
                     for target in targets:
                         if isinstance(target, NodeItem):
-                            nodzInst.currentHoveredNode = target
+                            nodzInst.setHoveredNode(target)
             else:
-                nodzInst.currentHoveredNode = None
+                nodzInst.setHoveredNode(None)
 
             # Set connection's end point.
             self.newConnection.target_point = self.mapToScene(event.pos())
@@ -1596,34 +2027,60 @@ class SlotItem(QtWidgets.QGraphicsItem):
 
         """
         nodzInst = self.scene().views()[0]
-        if event.button() == QtCore.Qt.LeftButton:
+        if event.button() == QtCore.Qt.LeftButton and self.newConnection is not None:
             nodzInst.drawingConnection = False
             nodzInst.currentDataType = None
 
             target = self.scene().itemAt(event.scenePos().toPoint(), QtGui.QTransform())
+            newConnection = self.newConnection
+            self.newConnection = None
 
             if not isinstance(target, SlotItem):
-                self.newConnection._remove()
+                newConnection._remove()
                 super(SlotItem, self).mouseReleaseEvent(event)
                 return
 
             if target.accepts(self):
-                self.newConnection.target = target
-                self.newConnection.source = self
-                self.newConnection.target_point = target.center()
-                self.newConnection.source_point = self.center()
+                newConnection.target = target
+                newConnection.source = self
+                newConnection.target_point = target.center()
+                newConnection.source_point = self.center()
 
                 # Perform the ConnectionItem.
-                self.connect(target, self.newConnection)
-                target.connect(self, self.newConnection)
+                self.connect(target, newConnection)
+                target.connect(self, newConnection)
+                self.scene().connections.add(newConnection)
 
-                self.newConnection.updatePath()
+                newConnection.updatePath()
             else:
-                self.newConnection._remove()
+                newConnection._remove()
         else:
             super(SlotItem, self).mouseReleaseEvent(event)
 
-        nodzInst.currentHoveredNode = None
+        nodzInst.setHoveredNode(None)
+
+    def mouseDoubleClickEvent(self, event):
+        """
+        Emit the double clicked attribute of this slot.
+
+        """
+        if event.button() == QtCore.Qt.LeftButton:
+            nodzInst = self.scene().views()[0]
+            nodzInst.signal_AttrDoubleClicked.emit(self.parentItem().name, self.attribute)
+        else:
+            super(SlotItem, self).mouseDoubleClickEvent(event)
+
+    def boundingRect(self):
+        """
+        The bounding rect, computed again only after the rows or the
+        width of the node changed.
+
+        """
+        node = self.parentItem()
+        if self._rectGeneration != node.slotsGeneration:
+            self._rect = self._slotRect()
+            self._rectGeneration = node.slotsGeneration
+        return self._rect
 
     def shape(self):
         """
@@ -1636,26 +2093,22 @@ class SlotItem(QtWidgets.QGraphicsItem):
 
     def paint(self, painter, option, widget):
         """
-        Paint the Slot.
+        Paint the Slot, unless zoomed out below lod_detail.
 
         """
+        nodzInst = self.scene().views()[0]
+        if option.levelOfDetailFromTransform(painter.worldTransform()) < nodzInst.styles.lodDetail:
+            return
+
         painter.setBrush(self.brush)
         painter.setPen(self.pen)
 
-        nodzInst = self.scene().views()[0]
-        config = nodzInst.config
         if nodzInst.drawingConnection:
             if self.parentItem() == nodzInst.currentHoveredNode:
-                painter.setBrush(convertDataToColor(config['non_connectable_color']))
                 if (self.slotType == nodzInst.sourceSlot.slotType or (self.slotType != nodzInst.sourceSlot.slotType and self.dataType != nodzInst.sourceSlot.dataType)):
-                    painter.setBrush(convertDataToColor(config['non_connectable_color']))
+                    painter.setBrush(nodzInst.styles.nonConnectableBrush)
                 else:
-                    _penValid = QtGui.QPen()
-                    _penValid.setStyle(QtCore.Qt.SolidLine)
-                    _penValid.setWidth(2)
-                    _penValid.setColor(QtGui.QColor(255, 255, 255, 255))
-                    painter.setPen(_penValid)
-                    painter.setBrush(self.brush)
+                    painter.setPen(nodzInst.styles.validSlotPen)
 
         painter.drawEllipse(self.boundingRect())
 
@@ -1712,12 +2165,11 @@ class PlugItem(SlotItem):
         Read the attribute style from the configuration file.
 
         """
-        config = parent.scene().views()[0].config
-        self.brush = QtGui.QBrush()
-        self.brush.setStyle(QtCore.Qt.SolidPattern)
-        self.brush.setColor(convertDataToColor(config[self.preset]['plug']))
+        styles = parent.scene().views()[0].styles
+        self.brush = styles.attr(self.preset)['plug']
+        self.pen = styles.slotPen
 
-    def boundingRect(self):
+    def _slotRect(self):
         """
         The bounding rect based on the width and height variables.
 
@@ -1770,6 +2222,7 @@ class PlugItem(SlotItem):
         # Add connection.
         if connection not in self.connections:
             self.connections.append(connection)
+        self.parentItem().connections.add(connection)
 
         # Emit signal.
         nodzInst = self.scene().views()[0]
@@ -1789,6 +2242,7 @@ class PlugItem(SlotItem):
             self.connected_slots.remove(connection.socketItem)
         # Remove connection
         self.connections.remove(connection)
+        self.parentItem().connections.discard(connection)
 
 
 class SocketItem(SlotItem):
@@ -1833,12 +2287,11 @@ class SocketItem(SlotItem):
         Read the attribute style from the configuration file.
 
         """
-        config = parent.scene().views()[0].config
-        self.brush = QtGui.QBrush()
-        self.brush.setStyle(QtCore.Qt.SolidPattern)
-        self.brush.setColor(convertDataToColor(config[self.preset]['socket']))
+        styles = parent.scene().views()[0].styles
+        self.brush = styles.attr(self.preset)['socket']
+        self.pen = styles.slotPen
 
-    def boundingRect(self):
+    def _slotRect(self):
         """
         The bounding rect based on the width and height variables.
 
@@ -1895,6 +2348,7 @@ class SocketItem(SlotItem):
         # Add connection.
         if connection not in self.connections:
             self.connections.append(connection)
+        self.parentItem().connections.add(connection)
 
         # Emit signal.
         nodzInst = self.scene().views()[0]
@@ -1914,6 +2368,7 @@ class SocketItem(SlotItem):
             self.connected_slots.remove(connection.plugItem)
         # Remove connections
         self.connections.remove(connection)
+        self.parentItem().connections.discard(connection)
 
 
 class ConnectionItem(QtWidgets.QGraphicsPathItem):
@@ -1992,10 +2447,6 @@ class ConnectionItem(QtWidgets.QGraphicsPathItem):
         """
         nodzInst = self.scene().views()[0]
 
-        for item in nodzInst.scene().items():
-            if isinstance(item, ConnectionItem):
-                item.setZValue(0)
-
         nodzInst.drawingConnection = True
 
         d_to_target = (event.pos() - self.target_point).manhattanLength()
@@ -2034,9 +2485,9 @@ class ConnectionItem(QtWidgets.QGraphicsPathItem):
             if nodzInst.sourceSlot.parentItem() not in targets:
                 for target in targets:
                     if isinstance(target, NodeItem):
-                        nodzInst.currentHoveredNode = target
+                        nodzInst.setHoveredNode(target)
         else:
-            nodzInst.currentHoveredNode = None
+            nodzInst.setHoveredNode(None)
 
         if self.movable_point == 'target_point':
             self.target_point = event.pos()
@@ -2052,6 +2503,7 @@ class ConnectionItem(QtWidgets.QGraphicsPathItem):
         """
         nodzInst = self.scene().views()[0]
         nodzInst.drawingConnection = False
+        nodzInst.setHoveredNode(None)
 
         slot = self.scene().itemAt(event.scenePos().toPoint(), QtGui.QTransform())
 
@@ -2102,6 +2554,7 @@ class ConnectionItem(QtWidgets.QGraphicsPathItem):
             self.target.disconnect(self)
 
         scene = self.scene()
+        scene.connections.discard(self)
         scene.removeItem(self)
         scene.update()
 
@@ -2122,6 +2575,19 @@ class ConnectionItem(QtWidgets.QGraphicsPathItem):
 
         self.setPath(path)
 
+    def paint(self, painter, option, widget):
+        """
+        Paint the curve, or a straight line when zoomed out below
+        lod_detail.
+
+        """
+        styles = self.scene().views()[0].styles
+        if option.levelOfDetailFromTransform(painter.worldTransform()) < styles.lodDetail:
+            painter.setPen(self.pen())
+            painter.drawLine(self.source_point, self.target_point)
+            return
+        super(ConnectionItem, self).paint(painter, option, widget)
+
 ############################################################################################################################
 ############################################################################################################################
 ############################################################################################################################
@@ -2197,256 +2663,652 @@ def on_keyPressed(key):
     print 'key pressed : ', key
 
 
-def u(value, size):
-    global endian
-    if endian == 'big':
-        e = ">"
-    else:
-        e = "<"
-    if size == 2:
-        return struct.unpack(e+"H", value)[0]
-    elif size == 4:
-        return struct.unpack(e+"I", value)[0]
-    elif size == 8:
-        return struct.unpack(e+"Q", value)[0]
+class StructChangeHook(idaapi.IDB_Hooks):
+    """
+    Invalidate cached struct layouts when structures are edited in the IDB.
+
+    """
+    def __init__(self):
+        idaapi.IDB_Hooks.__init__(self)
 
+    # Other structures may refer to the name or size, drop everything.
+    def struc_created(self, *args):
+        invalidate_struct_layouts()
+        return 0
 
-class NotDefinedObjectException(Exception):
-    def __init__(self, msg):
-        super(NotDefinedObjectException, self).__init__(msg)
+    def struc_deleted(self, *args):
+        invalidate_struct_layouts()
+        return 0
 
-class NoMemberFoundException(Exception):
-    def __init__(self, msg):
-        super(NoMemberFoundException, self).__init__(msg)
+    def struc_renamed(self, *args):
+        invalidate_struct_layouts()
+        return 0
 
-class CMember(object):
-    global bits, pat, nodz
+    def local_types_changed(self, *args):
+        invalidate_struct_layouts()
+        return 0
 
-    def __init__(self, address, offset, name, size, flag, member_id, idx, cobject=None):
-        self.address = address
-        self.offset = offset
-        self.name = name
-        self.size = size
-        self.flag = flag
-        self.member_id = member_id
-        self.type = idc.get_type(self.member_id)
-        self.is_array = False
-        self.idx = idx
-        self.cobject = cobject
-        self.connected_cobject = None
-        # even if use_dbg=False, get_bytes read memory from debugger. TODO check if this is true.
-        if self.type is None:
-            # Didn't defined type explicitly.
-
-            # Default value is integer(size=1,2,4,8).
-            if (idc.is_byte(self.flag) and self.size == 1) or (idc.is_word(self.flag) and self.size == 2) or (idc.is_dword(self.flag) and self.size == 4) or (idc.is_qword(self.flag) and self.size == 8):
-                self.value = u(idc.get_bytes(address, size, False), size)
-            else:
-                # maybe list
-                # TODO handle correctly if type isn't array (enum, bitfield, ...)
-                if idc.is_enum0(self.flag) or idc.is_bf(self.flag):
-                    raise Exception("Not implemented")
-                self.is_array = True
-                self.value = idc.get_bytes(address, size, False)
+    def closebase(self, *args):
+        invalidate_struct_layouts()
+        return 0
+
+    # Only the edited structure is affected.
+    def struc_expanded(self, sptr):
+        invalidate_struct_layouts(sptr.id)
+        return 0
+
+    def struc_align_changed(self, sptr):
+        invalidate_struct_layouts(sptr.id)
+        return 0
+
+    def struc_member_created(self, sptr, mptr):
+        invalidate_struct_layouts(sptr.id)
+        return 0
+
+    def struc_member_deleted(self, sptr, member_id, offset):
+        invalidate_struct_layouts(sptr.id)
+        return 0
+
+    def struc_member_renamed(self, sptr, mptr):
+        invalidate_struct_layouts(sptr.id)
+        return 0
+
+    def struc_member_changed(self, sptr, mptr):
+        invalidate_struct_layouts(sptr.id)
+        return 0
+
+
+class NodzGraphView(GraphListener):
+    """
+    Draw a CObjectManager graph with nodz.
+
+    One node per CObject or CList, one attribute per row.
+
+    """
+
+    # Row kind -> (preset, plug, socket, scrollable)
+    row_styles = {
+        'member': ('attr_preset_1', True, True, False),
+        'array': ('attr_preset_1', True, True, True),
+        'element': ('attr_preset_3', False, False, True),
+        'header': ('attr_preset_1', False, True, False),
+        'item': ('attr_preset_1', False, False, False),
+        'control': ('attr_preset_3', False, False, False),
+    }
+
+    def __init__(self, nodz, layout='layered'):
+        self.nodz = nodz
+        self.layout = layout
+        self.cmanager = None
+        # NodeItem of every object.
+        self.nodes = dict()
+        # Objects in the order they were added.
+        self.objects = []
+        # (src, src_label) -> (dst, dst_label) of every connection.
+        self.edges = dict()
+        # Object of every node name.
+        self.named = dict()
+        # Where the next child of an object goes until place() runs.
+        self._next_y = dict()
+        # Bottom of the subtree of an object, see _bottom_y().
+        self._extents = dict()
+        # (node, label, preset) of the rows changed by the last refresh.
+        self.highlighted = []
+
+    def attach(self, cmanager):
+        """
+        Forward the double clicks and scrolls of the nodes to cmanager.
+
+        """
+        self.cmanager = cmanager
+        self.nodz.signal_AttrDoubleClicked.connect(self.on_attr_double_clicked)
+        self.nodz.signal_AttrScrolled.connect(self.on_attr_scrolled)
+        self.nodz.signal_NodeMoved.connect(self.on_node_moved)
+
+    def object_added(self, obj, rows):
+        node = self.nodz.createNode(name=str(obj), preset='node_preset_1')
+        self.nodes[obj] = node
+        self.objects.append(obj)
+        self.named[node.name] = obj
+        for row in rows:
+            self._create_row(node, row, -1)
+        # Stack the children right of their parent as they arrive.
+        if obj.parent_cmember is not None:
+            parent = obj.parent_cmember.cobject
+            self._invalidate_extent(parent)
+            y = self._next_y.get(parent, self.nodes[parent].pos().y())
+            node.setPos(self._right_end(parent) + 40, y)
+            self._next_y[parent] = y + node.height + 40
+
+    def rows_changed(self, obj, rows):
+        node = self.nodes[obj]
+        # Marks would stick to renamed rows.
+        self._unmark([entry for entry in self.highlighted if entry[0] is node])
+        self.highlighted = [entry for entry in self.highlighted if entry[0] is not node]
+        self._sync_rows(node, rows)
+        self._invalidate_extent(obj)
+
+    def edge_added(self, src, src_label, dst, dst_label):
+        self.nodz.createConnection(str(src), src_label, str(dst), dst_label)
+        self.edges[(src, src_label)] = (dst, dst_label)
+
+    def graph_built(self, root):
+        if self.layout == 'layered':
+            self.auto_layout()
         else:
-            self.type = re.sub(pat, '', self.type)
-            # Struct or type defined explicitly.
-            if self.is_ptr:
-                self.value = u(idc.get_bytes(address, size, False), size)
-            else:
-                # handle type.
-                self.value = idc.get_bytes(address, size, False)
-        # TODO
-        # if self.is_ptr() -> Find CMember to which it points.(via CObjectManager?)
+            self.place(root)
+
+    def object_expanded(self, obj):
+        member = obj.parent_cmember
+        parent = self.nodes[member.cobject]
+        row = parent.attrs.index(str(member))
+        self.nodes[obj].setPos(self._right_end(member.cobject) + 40, parent.pos().y() + parent.attrHeight * row)
+        self._invalidate_extent(obj)
+
+    def edge_removed(self, src, src_label):
+        self.edges.pop((src, src_label), None)
+        plug = self.nodes[src].plugs.get(src_label)
+        if plug is not None:
+            while plug.connections:
+                plug.connections[0]._remove()
 
-    def connect(self, target_cmember):
-        self.connected_cobject = target_cmember
-        nodz.createConnection(str(self.cobject), str(self), str(target_cmember.cobject), str(target_cmember))
+    def values_changed(self, obj, rows, changed):
+        node = self.nodes[obj]
+        self._sync_rows(node, rows)
+        self._invalidate_extent(obj)
+        kinds = dict(rows)
+        for label in changed:
+            self.highlighted.append((node, label, self.row_styles[kinds[label]][0]))
+            self.nodz.editAttribute(node=node, index=node.attrs.index(label), newPreset=highlight_preset)
 
-    @property
-    def is_ptr(self):
-        return idc.is_off0(self.flag)
+    def refresh(self):
+        """
+        Read the objects again and highlight what changed since the last
+        refresh.
 
-    @property
-    def is_valid_ptr(self):
         """
+        old = self.highlighted
+        self.highlighted = []
+        if not self.cmanager.refresh():
+            # Several events may report the same stop, keep the marks.
+            self.highlighted = old
+            return
+        marked = set((node, label) for node, label, preset in self.highlighted)
+        self._unmark([entry for entry in old if entry[:2] not in marked])
+
+    def _unmark(self, entries):
+        for node, label, preset in entries:
+            if label in node.attrs:
+                self.nodz.editAttribute(node=node, index=node.attrs.index(label), newPreset=preset)
+
+    def _create_row(self, node, row, index):
+        preset, plug, socket, scrollable = self.row_styles[row.kind]
+        self.nodz.createAttribute(node=node, name=row.label, index=index, preset=preset, plug=plug, socket=socket, dataType=str,
+                                  scrollable=scrollable)
+
+    def _sync_rows(self, node, rows):
+        """
+        Turn the attributes of node into rows with as few edits as possible.
+
+        Rows are matched by position: the common head and tail are kept, the
+        middle is renamed in place, and only the difference in length is
+        created or deleted, so connections of renamed rows survive.
+
+        """
+        labels = [row.label for row in rows]
+        attrs = node.attrs
+        head = 0
+        while head < len(attrs) and head < len(labels) and attrs[head] == labels[head]:
+            head += 1
+        tail = 0
+        while (tail < len(attrs) - head and tail < len(labels) - head and
+               attrs[len(attrs) - 1 - tail] == labels[len(labels) - 1 - tail]):
+            tail += 1
+        common = min(len(attrs), len(labels)) - head - tail
+
+        for index in range(len(attrs) - tail - 1, head + common - 1, -1):
+            self.nodz.deleteAttribute(node=node, index=index)
+
+        # A label may still be used by another row of the middle, rename
+        # that row first. If the renames form a cycle, park one row under a
+        # free name.
+        pending = [i for i in range(head, head + common) if node.attrs[i] != labels[i]]
+        while pending:
+            blocked = []
+            for i in pending:
+                if labels[i] in node.attrs:
+                    blocked.append(i)
+                else:
+                    self.nodz.editAttribute(node=node, index=i, newName=labels[i])
+            if len(blocked) == len(pending):
+                parked = node.attrs[blocked[0]]
+                while parked in node.attrs:
+                    parked += ' '
+                self.nodz.editAttribute(node=node, index=blocked[0], newName=parked)
+            pending = blocked
 
-        :return:
+        for i in range(head + common, len(labels) - tail):
+            self._create_row(node, rows[i], i)
+
+    def visible_rect(self):
         """
-        global bits
-        return self.is_ptr and idc.is_mapped(self.value)
 
-    @property
-    def ptr_struct_name(self):
+        :return: (left, top, right, bottom) of the viewport in scene coordinates.
         """
-        Handy dereference structure name.
-        struc_x *** -> struc_x **
-        :return: structure name to which CMember point.
+        rect = self.nodz.mapToScene(self.nodz.viewport().rect()).boundingRect()
+        return (rect.left(), rect.top(), rect.right(), rect.bottom())
+
+    def distance_to_rect(self, obj, rect):
         """
-        assert self.is_ptr
-        if self.type is None:
-            return None
-        assert self.type[-1] == '*'
-        return self.type[:-1].rstrip(' ')
 
-    @property
-    def is_struct(self):
-        return idc.is_struct(self.flag)
+        :return: Manhattan distance from the node of obj to rect, 0 if it is inside.
+        """
+        pos = self.nodes[obj].pos()
+        left, top, right, bottom = rect
+        return max(left - pos.x(), 0, pos.x() - right) + max(top - pos.y(), 0, pos.y() - bottom)
 
-    @property
-    def bottom_y(self):
+    def _right_end(self, obj):
         """
 
+        :return:
+        """
+        node = self.nodes[obj]
+        return node.pos().x() + node.width
+
+    def _bottom_y(self, obj):
+        """
+        Computed bottom-up once, then kept until an object of the subtree
+        is added, resized or moved.
+
         :return: max(self.bottom, max(self.childlen's bottom))
         """
-        if self.idx == 0:
-            return self.cobject.node.pos().y()
+        extents = self._extents
+        stack = [obj]
+        while stack:
+            current = stack[-1]
+            if current in extents:
+                stack.pop()
+                continue
+            missing = [child for child in current.children if child not in extents]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            node = self.nodes[current]
+            bottom = node.pos().y() + node.height
+            for child in current.children:
+                bottom = max(bottom, extents[child])
+            extents[current] = bottom
+        return extents[obj]
+
+    def _invalidate_extent(self, obj):
+        """
+        Forget the extent of obj and of its ancestors.
+
+        Extents are only kept when the extents of the whole subtree are, so
+        the walk stops at the first ancestor without one.
+
+        """
+        while obj in self._extents:
+            del self._extents[obj]
+            if obj.parent_cmember is None:
+                break
+            obj = obj.parent_cmember.cobject
+
+    def place(self, root):
+        """
+        Put every object right of its parent, below the subtree of its
+        previous sibling.
+
+        """
+        stack = [[root, iter(root.children), self.nodes[root].pos().y()]]
+        while stack:
+            frame = stack[-1]
+            obj, children, y = frame
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                if stack:
+                    stack[-1][2] = self._bottom_y(obj) + 40 # shift down a little bit
+                continue
+            self.nodes[child].setPos(self._right_end(obj) + 40, y) # shift right a little bit
+            self._invalidate_extent(child)
+            stack.append([child, iter(child.children), y])
 
-    def __repr__(self):
-        # Do you want type name?
-        # TODO if string, preview string?
-        if isinstance(self.value, (int, long)):
-            return self.name + '  ' + ("0x{0:0" + str(self.size * 2) + "x}").format(self.value)
-        else:
-            return self.name + '  ' + "PREVIEW"
+    def auto_layout(self):
+        """
+        Lay out the whole graph in layers by depth, ordered to keep the
+        connections short and uncrossed.
+
+        """
+        sizes = dict()
+        rows = dict()
+        for obj in self.objects:
+            node = self.nodes[obj]
+            sizes[obj] = (node.width, node.height)
+            rows[obj] = dict((label, index) for index, label in enumerate(node.attrs))
+
+        def row_y(obj, label):
+            node = self.nodes[obj]
+            return node.baseHeight + node.attrHeight * (rows[obj].get(label, 0) + 0.5)
+
+        edges = [(src, row_y(src, src_label), dst, row_y(dst, dst_label))
+                 for (src, src_label), (dst, dst_label) in self.edges.items()]
+        ranks = dict((obj, obj.depth) for obj in self.objects)
+        coords = layered_layout(self.objects, ranks, sizes, edges)
+        self._extents.clear()
+        for obj, (x, y) in coords.items():
+            self.nodes[obj].setPos(x, y)
+
+    def on_node_moved(self, node_name, pos):
+        obj = self.named.get(node_name)
+        if obj is not None:
+            self._invalidate_extent(obj)
+
+    def on_attr_scrolled(self, node_name, attr_name, steps):
+        self.cmanager.on_attr_scrolled(node_name, attr_name, steps)
+
+    def on_attr_double_clicked(self, node_name, attr_name):
+        try:
+            self.cmanager.on_attr_double_clicked(node_name, attr_name)
+        except (NotDefinedObjectException, MemoryReadException) as e:
+            print e
+
+
+def invalidate_read_cache():
+    """
+    Drop the cached memory of the open view.
+
+    """
+    if cmanager is not None:
+        cmanager.backend.invalidate()
+
+class MemoryWriteHook(idaapi.IDB_Hooks):
+    """
+    Invalidate the read cache when bytes are patched.
+
+    """
+    def __init__(self):
+        idaapi.IDB_Hooks.__init__(self)
+
+    def byte_patched(self, *args):
+        invalidate_read_cache()
+        return 0
+
+class DebuggerRefreshHook(idaapi.DBG_Hooks):
+    """
+    Invalidate the read cache whenever the debugger stops or the process
+    changes, and refresh the open object view on stops.
+
+    """
+    def __init__(self):
+        idaapi.DBG_Hooks.__init__(self)
+
+    def refresh(self):
+        invalidate_read_cache()
+        # Nothing to do until a view is built.
+        if not live_refresh or graph_view is None or graph_view.cmanager is None:
+            return
+        try:
+            graph_view.refresh()
+        except Exception as e:
+            print e
+
+    def dbg_suspend_process(self):
+        self.refresh()
+        return 0
+
+    def dbg_bpt(self, tid, ea):
+        self.refresh()
+        return 0
+
+    def dbg_step_into(self):
+        self.refresh()
+        return 0
+
+    def dbg_step_over(self):
+        self.refresh()
+        return 0
+
+    def dbg_step_until_ret(self):
+        self.refresh()
+        return 0
+
+    def dbg_run_to(self, pid, tid, ea):
+        self.refresh()
+        return 0
 
+    def dbg_process_start(self, *args):
+        invalidate_read_cache()
+        return 0
 
-class CObject(object):
-    global nodz
+    def dbg_process_exit(self, *args):
+        invalidate_read_cache()
+        return 0
 
-    def __init__(self, address, struct_name, pos, cmanager=None, parent_cmember=None):
-        self.address = address
-        self.members = []
-        self.struct_name = re.sub(pat, '', struct_name)
-        self.struct_id = idaapi.get_struc_id(self.struct_name)
-        self.size = idc.get_struc_size(self.struct_id)
+    def dbg_process_attach(self, *args):
+        invalidate_read_cache()
+        return 0
+
+    def dbg_process_detach(self, *args):
+        invalidate_read_cache()
+        return 0
+
+
+class GraphLoader(GraphListener):
+    """
+    Run CObjectManager.build on a worker thread and populate the scene
+    from the UI thread.
+
+    The worker queues the graph events. A QTimer inserts the items in
+    slices of at most frame_budget seconds, so the view repaints, pans and
+    zooms while a big graph is still loading. Objects near the viewport go
+    first, then by depth. An object is only inserted after its parent, an
+    edge after both of its ends. The stubs become clickable once the build
+    is done.
+
+    """
+
+    # Time spent inserting items per timer tick, in seconds.
+    frame_budget = 0.008
+    # Timer period in ms.
+    interval = 16
+
+    def __init__(self, view):
+        self.view = view
+        self.cmanager = None
+        # (method name, args), appended by the worker.
+        self.events = deque()
+        self.error = None
+        self.done = False
+        # The window was closed.
+        self.closed = False
+        self.root = None
+        self.thread = None
+        # Objects whose parent is in the scene, as [key, seq, obj].
+        self.heap = []
+        self.seq = 0
+        self.last_rect = None
+        # Latest rows of objects not in the scene yet.
+        self.pending_rows = dict()
+        # Events waiting for the given object to be inserted.
+        self.blocked = dict()
+        # Events whose objects are all in the scene.
+        self.ready = deque()
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.flush)
+
+    def start(self, cmanager):
         self.cmanager = cmanager
-        # set parent object
-        self.parent_cmember = parent_cmember
-        self.node = nodz.createNode(name=str(self), preset='node_preset_1', position=pos)
-        if self.struct_id == idc.BADADDR:
-            raise NotDefinedObjectException(self.struct_name + ' isn\'t defined. Please insert into structure window.')
-        if idc.is_union(self.struct_id):
-            raise NotDefinedObjectException("Union Not supported now.")
-
-        idx = 0 # TODO remove this and bottom_y of CMember
-        for member in idautils.StructMembers(self.struct_id):
-            offset, name, size = member
-            # TODO if member is struct, expand struct members.
-            # TODO if member is array, expand array members.( But db array is maybe string, and user don't want it to expand... ) Only expand dd|dw|dq array?
-            cmember = CMember(address + offset, offset, name, size, idc.get_member_flag(self.struct_id, offset), idc.get_member_id(self.struct_id, offset), idx, cobject=self)
-            self.members.append(cmember)
-            idx += 1
-        if self.members is []:
-            raise NoMemberFoundException("No member found at " + struct_name)
-
-        for member in self.members:
-            nodz.createAttribute(node=self.node, name=str(member), index=-1, preset='attr_preset_1', plug=True, socket=True, dataType=str)
-
-    def connect(self):
-        pos = self.node.pos()
-        pos.setX(self.right_end + 40) # shift right a little bit
-        for member in self.members:
-            if member.is_valid_ptr:
-                if self.cmanager.is_contain(member.value):
-                    # address already exists.
-                    member.connect(self.cmanager.search_cmember(member.value))
-                else:
-                    # create cobject
-                    cobj = self.cmanager.add_cobject(member.value, member.ptr_struct_name, pos, parent_cmember=member)
-                    member.connect(cobj.members[0]) # connect to top member
-                    pos.setY(cobj.bottom_y + 40) # shift down a little bit
-
-    def is_contain(self, address):
-        if self.address <= address < self.address + self.size:
-            return True
-        return False
-
-    def search_cmember(self, address):
-        for member in self.members:
-            if member.address <= address < member.address + member.size:
-                return member
-        return None
+        cmanager.listener = self
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        self.timer.start(self.interval)
 
-    @property
-    def right_end(self):
+    def cancel(self):
+        if self.cmanager is not None:
+            self.cmanager.cancel()
+
+    def close(self):
         """
+        Stop loading after the window was closed. The backend is released
+        once the worker is done.
 
-        :return:
         """
-        return self.node.pos().x() + self.node.width
+        self.closed = True
+        self.cancel()
+        if not self.timer.isActive():
+            self._release()
 
-    @property
-    def bottom_y(self):
+    def _release(self):
+        backend = self.cmanager.backend
+        if isinstance(backend, SnapshotBackend):
+            backend.close()
+
+    def _run(self):
+        try:
+            self.cmanager.build()
+        except Exception as e:
+            self.error = e
+        self.done = True
+
+    def object_added(self, obj, rows):
+        self.events.append(('object_added', (obj, rows)))
+
+    def rows_changed(self, obj, rows):
+        self.events.append(('rows_changed', (obj, rows)))
+
+    def edge_added(self, src, src_label, dst, dst_label):
+        self.events.append(('edge_added', (src, src_label, dst, dst_label)))
+
+    def graph_built(self, root):
+        self.events.append(('graph_built', (root,)))
+
+    def _parent(self, obj):
+        if obj.parent_cmember is None:
+            return None
+        return obj.parent_cmember.cobject
+
+    def _key(self, obj, rect):
         """
 
-        :return: max(self.bottom, max(self.childlen's bottom))
+        :return: (distance from the viewport to where obj will be placed, depth)
         """
-        bottom = self.node.pos().y() + self.node.height
-        for member in self.members:
-            if member.is_valid_ptr:
-                bottom = max(bottom, member.connected_cobject.bottom_y)
-        return bottom
+        parent = self._parent(obj)
+        if parent is None:
+            return (0, 0)
+        return (self.view.distance_to_rect(parent, rect), obj.depth)
+
+    def _push(self, obj):
+        self.seq += 1
+        heapq.heappush(self.heap, [self._key(obj, self.last_rect), self.seq, obj])
 
-    def __repr__(self):
-        return self.struct_name + '@' + hex(self.address)
+    def _wait(self, event, objs):
+        """
+        Queue event until every object of objs is in the scene.
 
+        """
+        missing = [obj for obj in objs if obj not in self.view.nodes]
+        if missing:
+            self.blocked.setdefault(missing[0], []).append(event)
+        else:
+            self.ready.append(event)
 
-class CObjectManager(object):
-    global pat
+    def _dispatch(self):
+        """
+        Sort the events queued by the worker.
 
-    def __init__(self, nodz, max_depth, main_address, main_struct_name):
-        self.nodz = nodz
-        self.max_depth = max_depth
-        self.main_address = main_address
-        self.main_struct_name = main_struct_name
-        self.cobjects = []
-        self.add_cobject(main_address, main_struct_name, None)
-
-    def debug_dump(self):
-        for cobject in self.cobjects:
-            print "CObject : " + hex(cobject.address)
-            print "=============================="
-            for member in cobject.members:
-                print member
-            print "=============================="
-
-    def add_cobject(self, address, struct_name, pos, parent_cmember=None):
-        if self.is_contain(address):
+        """
+        while self.events:
+            event = self.events.popleft()
+            name, args = event
+            if name == 'object_added':
+                obj, rows = args
+                self.pending_rows[obj] = rows
+                parent = self._parent(obj)
+                if parent is None or parent in self.view.nodes:
+                    self._push(obj)
+                else:
+                    self.blocked.setdefault(parent, []).append(('insert', (obj,)))
+            elif name == 'rows_changed':
+                obj, rows = args
+                if obj in self.pending_rows:
+                    self.pending_rows[obj] = rows
+                else:
+                    self.ready.append(event)
+            elif name == 'edge_added':
+                self._wait(event, (args[0], args[2]))
+            elif name == 'graph_built':
+                self.root = args[0]
+
+    def _insert(self, obj):
+        self.view.object_added(obj, self.pending_rows.pop(obj))
+        for event in self.blocked.pop(obj, []):
+            name, args = event
+            if name == 'insert':
+                self._push(args[0])
+            else:
+                self._wait(event, (args[0], args[2]))
+
+    def _reprioritize(self):
+        """
+        Recompute the keys when the viewport moved.
+
+        """
+        rect = self.view.visible_rect()
+        if rect == self.last_rect:
             return
-        cobj = CObject(address, struct_name, pos, cmanager=self, parent_cmember=parent_cmember)
-        self.cobjects.append(cobj)
-        cobj.connect()
-        return cobj
-
-    def search_cmember(self, address):
-        obj = self.search_cobject(address)
-        return obj.search_cmember(address)
-
-    def search_cobject(self, address):
-        for obj in self.cobjects:
-            if obj.is_contain(address):
-                return obj
-        return None
+        self.last_rect = rect
+        for entry in self.heap:
+            entry[0] = self._key(entry[2], rect)
+        heapq.heapify(self.heap)
 
-    def is_contain(self, address):
+    def flush(self):
         """
+        Insert items until the frame budget is spent.
 
-        :param address: Memory address.
-        :return: True when object with specified address already added.
         """
-        for obj in self.cobjects:
-            if obj.is_contain(address):
-                return True
-        return False
+        # Read before dispatching, the worker queues everything before done.
+        done = self.done
+        if self.closed:
+            if done:
+                self.timer.stop()
+                self._release()
+            return
+        self._reprioritize()
+        self._dispatch()
+        deadline = time.time() + self.frame_budget
+        while time.time() < deadline:
+            if self.ready:
+                name, args = self.ready.popleft()
+                getattr(self.view, name)(*args)
+            elif self.heap:
+                self._insert(heapq.heappop(self.heap)[2])
+            else:
+                break
+        if not done or self.events or self.ready or self.heap:
+            return
 
-    def auto_layout(self):
-        for cobject in self.cobjects:
-            print cobject.bottom_y
+        self.timer.stop()
+        if self.error is not None:
+            print self.error
+            if not self.cmanager.cobjects:
+                return
+            # Lay out and attach what was read before the error.
+            self.root = self.cmanager.cobjects[0]
+        self.view.graph_built(self.root)
+        self.cmanager.listener = self.view
+        self.view.attach(self.cmanager)
+        self.cmanager.debug_dump()
+        backend = self.cmanager.backend
+        if isinstance(backend, CachedBackend):
+            print 'Read cache: {0} hits, {1} misses'.format(backend.hits, backend.misses)
 
 def object_view_main():
-    global nodz #VERY IMPORTANT!!!!
     global max_depth
+    global read_cache_page_size, read_cache_size
+    global bits, endian
     global dbg_active
     #check if debugger active
 
@@ -2472,13 +3334,82 @@ def object_view_main():
     if not struct_name:
         return
 
+    backend = CachedBackend(SyncedIDABackend(bits, endian), read_cache_page_size, read_cache_size)
+    show_object_view(backend, address, struct_name, max_depth)
+
+
+def save_snapshot_main():
+    """
+    Save the open object view to a snapshot file.
+
+    """
+    if graph_view is None or graph_view.cmanager is None:
+        print "No loaded object view to save."
+        return
+    path = ida_kernwin.ask_file(1, "*.iovs", "Save object graph snapshot")
+    if not path:
+        return
+    try:
+        save_snapshot(graph_view.cmanager, path)
+    except (IOError, OSError) as e:
+        print e
+        return
+    print "Snapshot saved to " + path
+
+
+def snapshot_view_main():
+    """
+    Open a snapshot file in a new object view. Its memory and structures
+    come from the file, no debugger is needed.
+
+    """
+    path = ida_kernwin.ask_file(0, "*.iovs", "Open object graph snapshot")
+    if not path:
+        return
+    try:
+        backend = SnapshotBackend(path)
+    except (IOError, OSError, SnapshotException) as e:
+        print e
+        return
+    show_object_view(backend, backend.root_address, backend.root_struct_name, backend.max_depth, backend.graph)
+
+
+def close_object_view(view, loader):
+    """
+    Forget the view of a closed window, and stop loading it.
+
+    """
+    global cmanager, graph_view, graph_loader
+    if graph_view is view:
+        cmanager = None
+        graph_view = None
+        graph_loader = None
+    loader.close()
+
+
+def show_object_view(backend, address, struct_name, depth, saved_graph=None):
+    """
+    Open a nodz window with the graph of struct_name at address.
+
+    :param backend: Where the memory and structures are read from.
+    :param depth: Depth of the traversal.
+    :param saved_graph: SavedGraph of a snapshot, restored instead of
+                        traversing.
+
+    """
+    global nodz #VERY IMPORTANT!!!!
+    global cmanager, graph_view, graph_loader
+    global max_nodes, max_bytes, list_min_length, list_page_size, array_window
+    global read_gap
 
     config_s = {
         "scene_width": 2000,
         "scene_height": 2000,
         "grid_size": 36,
+        "grid_min_spacing": 8,
         "antialiasing": True,
         "antialiasing_boost": True,
+        "render_profile": "smart",
         "smooth_pixmap": True,
 
         "node_font": "Arial",
@@ -2494,6 +3425,9 @@ def object_view_main():
         "node_attr_height": 30,
         "connection_width": 2,
 
+        "lod_text": 0.4,
+        "lod_detail": 0.2,
+
         "alternate_value": 20,
         "grid_color": [50, 50, 50, 255],
         "slot_border": [50, 50, 50, 255],
@@ -2570,14 +3504,21 @@ def object_view_main():
 
     nodz.signal_KeyPressed.connect(on_keyPressed)
 
-    try:
-        com = CObjectManager(nodz, max_depth, address, struct_name)
-        com.auto_layout()
-    except NotDefinedObjectException as e:
-        print e
-        print "Please report to me. X("
-        return
-    com.debug_dump()
+    view = NodzGraphView(nodz, graph_layout)
+    com = CObjectManager(backend, address, struct_name, listener=view, max_depth=depth,
+                         max_nodes=max_nodes, max_bytes=max_bytes, list_min_length=list_min_length,
+                         list_page_size=list_page_size, array_window=array_window, read_gap=read_gap,
+                         saved_graph=saved_graph)
+    # Keep the manager alive, it expands stubs on double click.
+    cmanager = com
+    graph_view = view
+    if graph_loader is not None:
+        graph_loader.cancel()
+    # Read memory on a worker thread, nodes show up as they are found.
+    graph_loader = GraphLoader(view)
+    graph_loader.start(com)
+    loader = graph_loader
+    nodz.signal_Closed.connect(lambda: close_object_view(view, loader))
 
     """
     # Node A
@@ -2669,12 +3610,13 @@ def object_view_main():
 
 
 class object_viewer_handler(idaapi.action_handler_t):
-    def __init__(self):
+    def __init__(self, main=object_view_main):
         idaapi.action_handler_t.__init__(self)
+        self.main = main
 
     def activate(self, ctx):
         try:
-            action = object_view_main()
+            action = self.main()
         except Exception as e:
             print(e)
         return 1
@@ -2714,16 +3656,38 @@ class ObjectViewerPlugin(idaapi.plugin_t):
         print "Object Viewer Plugin loaded."
         self.ui_hook = UIHook()
         self.ui_hook.hook()
+        self.struct_hook = StructChangeHook()
+        self.struct_hook.hook()
+        self.write_hook = MemoryWriteHook()
+        self.write_hook.hook()
+        self.dbg_hook = DebuggerRefreshHook()
+        self.dbg_hook.hook()
         self.action = idaapi.action_desc_t("Object View", "Object View", object_viewer_handler(), "")
         idaapi.register_action(self.action)
+        self.snapshot_actions = [
+            idaapi.action_desc_t("Object View: Save snapshot", "Object View: Save snapshot...",
+                                 object_viewer_handler(save_snapshot_main), ""),
+            idaapi.action_desc_t("Object View: Open snapshot", "Object View: Open snapshot...",
+                                 object_viewer_handler(snapshot_view_main), ""),
+        ]
+        for action in self.snapshot_actions:
+            idaapi.register_action(action)
+            idaapi.attach_action_to_menu("Edit/Plugins/", action.name, idaapi.SETMENU_APP)
         return idaapi.PLUGIN_KEEP
 
     def run(self, arg):
         pass
 
     def term(self):
+        if graph_loader is not None:
+            graph_loader.cancel()
         self.ui_hook.unhook()
+        self.struct_hook.unhook()
+        self.write_hook.unhook()
+        self.dbg_hook.unhook()
         idaapi.unregister_action("Object View")
+        for action in self.snapshot_actions:
+            idaapi.unregister_action(action.name)
         pass
 
 def PLUGIN_ENTRY():